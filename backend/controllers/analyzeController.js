@@ -1,4 +1,105 @@
+const { execFile } = require("child_process");
 const fetch = require("node-fetch");
+const path = require("path");
+const PythonWorkerPool = require("../utils/pythonWorkerPool");
+const { getQueue, workersForShare, isAsyncRequest, sendAccepted, errorStatus } = require("../utils/jobQueue");
+
+// ANALYZE_BACKEND=local runs audiotonotes.py in warm workers on this machine
+// instead of calling the hosted Hugging Face space.
+const useLocalWorkers = process.env.ANALYZE_BACKEND === "local";
+let analyzePool = null;
+
+// Analysis gets ANALYZE_CPU_SHARE of the job core budget (see utils/jobQueue.js)
+const analyzeWorkers = () =>
+  workersForShare(Number(process.env.ANALYZE_CPU_SHARE) || 0.5, process.env.ANALYZE_WORKERS);
+
+// Clips of unknown length sort behind typical recordings
+const DEFAULT_CLIP_SECONDS = 30;
+const clipSeconds = (duration) => (Number(duration) > 0 ? Number(duration) : DEFAULT_CLIP_SECONDS);
+
+// Worker timeout for one recording: long recordings are analyzed in windows
+// (chunk_seconds) and can run for minutes, so the budget grows with the
+// audio length; recordings of unknown length get UNKNOWN_LENGTH_SECONDS' worth.
+const BASE_TIMEOUT_MS = 120000;
+const MS_PER_AUDIO_SECOND = Number(process.env.ANALYZE_MS_PER_AUDIO_SECOND) || 3000;
+const UNKNOWN_LENGTH_SECONDS = 600;
+const analysisTimeoutMs = (seconds) =>
+  BASE_TIMEOUT_MS + (seconds || UNKNOWN_LENGTH_SECONDS) * MS_PER_AUDIO_SECOND;
+
+// audiotonotes.py also reads local files, which only the CLI and --batch may
+// use: requests must name http(s) URLs so a client can't make the workers
+// decode arbitrary files from the server's disk.
+const isHttpUrl = (url) => typeof url === "string" && /^https?:\/\//i.test(url);
+
+// Recording length in seconds as reported by ffprobe, or null when it is not
+// an http(s) URL or the container does not say (e.g. some recorder WebM)
+const probeSeconds = (audioUrl) => new Promise((resolve) => {
+  if (!isHttpUrl(audioUrl)) return resolve(null);
+  execFile("ffprobe", [
+    "-v", "error", "-show_entries", "format=duration", "-of", "default=noprint_wrappers=1:nokey=1", audioUrl,
+  ], { timeout: 15000 }, (err, stdout) => {
+    const seconds = Number(String(stdout).trim());
+    resolve(!err && seconds > 0 ? seconds : null);
+  });
+});
+
+// Length the client reported, else whatever ffprobe finds
+const audioSeconds = async (audioUrl, duration) =>
+  (Number(duration) > 0 ? Number(duration) : probeSeconds(audioUrl));
+
+// Analysis options a request may set. Everything else (CREPE backend and
+// model, timeouts, profiling, chunking) stays under the server's control.
+const CLIENT_OPTIONS = ["quality", "corrections", "denoise", "fusion", "pitch_tracker"];
+
+const clientOptions = (options) => {
+  if (!options || typeof options !== "object") return undefined;
+  const allowed = {};
+  for (const [key, value] of Object.entries(options)) {
+    if (CLIENT_OPTIONS.includes(key)) {
+      allowed[key] = value;
+    } else {
+      console.warn(`[analyzeAudio] Ignoring analysis option "${key}" from client`);
+    }
+  }
+  return allowed;
+};
+
+const getAnalyzePool = () => {
+  if (!analyzePool) {
+    const scriptPath = path.join(__dirname, "..", "python", "audiotonotes.py");
+    const size = analyzeWorkers();
+    const args = [];
+    if (process.env.ANALYZE_MODEL_CAPACITY) {
+      args.push("--model-capacity", process.env.ANALYZE_MODEL_CAPACITY);
+    }
+    // fast | adaptive | full; requests can still override it with options.quality
+    if (process.env.ANALYZE_QUALITY) {
+      args.push("--quality", process.env.ANALYZE_QUALITY);
+    }
+    analyzePool = new PythonWorkerPool(scriptPath, { size, args }).start();
+  }
+  return analyzePool;
+};
+
+// Every local analysis goes through this queue, which runs at most one job
+// per pool worker and lets short clips overtake long ones.
+const getAnalyzeQueue = () => getQueue("analyze", {
+  concurrency: analyzeWorkers(),
+  maxQueued: Number(process.env.ANALYZE_MAX_QUEUED) || 50,
+});
+
+const analyzeLocally = async (audioUrl, options, seconds) => {
+  const result = await getAnalyzePool().run(
+    { audio_url: audioUrl, options },
+    { timeoutMs: analysisTimeoutMs(seconds) }
+  );
+  if (!result.success) {
+    console.error("[analyzeAudio] [Python Worker Error]", result.error);
+    throw new Error(result.error || "Analysis failed");
+  }
+  console.log("[analyzeAudio] Python worker result:", result);
+  return result;
+};
 
 exports.analyzeAudio = async (req, res) => {
   const { audioUrl } = req.body;
@@ -8,6 +109,28 @@ exports.analyzeAudio = async (req, res) => {
     console.log("[analyzeAudio] audioUrl missing in request body");
     return res.status(400).json({ error: "audioUrl is required" });
   }
+  if (!isHttpUrl(audioUrl)) {
+    return res.status(400).json({ error: "audioUrl must be an http(s) URL" });
+  }
+
+  if (useLocalWorkers) {
+    try {
+      const seconds = await audioSeconds(audioUrl, req.body.duration);
+      const queue = getAnalyzeQueue();
+      const job = queue.submit(() => analyzeLocally(audioUrl, clientOptions(req.body.options), seconds), {
+        priority: clipSeconds(seconds),
+        meta: { audioUrl },
+      });
+      if (isAsyncRequest(req)) {
+        return sendAccepted(res, queue, job);
+      }
+      const data = await job.promise;
+      return res.status(200).json({ success: true, data });
+    } catch (err) {
+      console.error("[analyzeAudio] Local analysis failed:", err.message);
+      return res.status(errorStatus(res, err)).json({ success: false, error: err.message });
+    }
+  }
 
   try {
     const response = await fetch("https://arcriser-audiotonotes.hf.space/analyze", {
@@ -31,66 +154,43 @@ exports.analyzeAudio = async (req, res) => {
   }
 };
 
+// Bulk re-analysis always runs on the local workers: one job per batch so
+// the worker can decode concurrently and batch CREPE across recordings.
+exports.analyzeBatch = async (req, res) => {
+  const { audioUrls } = req.body;
+  const options = clientOptions(req.body.options);
 
+  if (!Array.isArray(audioUrls) || !audioUrls.length) {
+    return res.status(400).json({ error: "audioUrls must be a non-empty array" });
+  }
+  if (!audioUrls.every(isHttpUrl)) {
+    return res.status(400).json({ error: "audioUrls must all be http(s) URLs" });
+  }
 
+  const runBatch = async () => {
+    const timeoutMs = Math.max(120000, audioUrls.length * 60000);
+    const result = await getAnalyzePool().run({ audio_urls: audioUrls, options }, { timeoutMs });
+    if (!result.success) {
+      throw new Error(result.error || "Batch analysis failed");
+    }
+    const failed = result.results.filter((item) => !item.success).length;
+    console.log(`[analyzeBatch] ${audioUrls.length} recordings analyzed, ${failed} failed`);
+    return result.results;
+  };
 
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-// // backend/controllers/analyzeController.js
-// const runPython = require("../utils/runPython");
-// const path = require("path"); // <--- Make sure to import 'path'
-
-// exports.analyzeAudio = async (req, res) => {
-//   console.log("[analyzeAudio] Incoming request body:", req.body);
-//   const { audioUrl } = req.body;
-
-//   if (!audioUrl) {
-//     console.log("[analyzeAudio] audioUrl missing in request body");
-//     return res.status(400).json({ error: "audioUrl is required" });
-//   }
-
-//   try {
-//     // Construct the correct absolute path to the Python script inside the container
-//     const scriptPath = path.join(__dirname, "..", "python", "audiotonotes.py");
-//     console.log("[analyzeAudio] Using scriptPath:", scriptPath);
-//     // Now pass the correct path to runPython
-//     const result = await runPython(scriptPath, [audioUrl]);
-//     console.log("[analyzeAudio] Python script result:", result);
-//     return res.status(200).json({ success: true, data: result });
-//   } catch (err) {
-//     console.error("[analyzeAudio] [Python Script Error]", err.stderr || err.message);
-//     return res.status(500).json({
-//       success: false,
-//       error: err.message || "Unexpected error",
-//       stderr: err.stderr,
-//       stdout: err.stdout,
-//     });
-//   }
-// };
\ No newline at end of file
+  try {
+    const queue = getAnalyzeQueue();
+    const job = queue.submit(runBatch, {
+      priority: audioUrls.length * DEFAULT_CLIP_SECONDS,
+      meta: { batch: audioUrls.length },
+    });
+    if (isAsyncRequest(req)) {
+      return sendAccepted(res, queue, job);
+    }
+    const data = await job.promise;
+    return res.status(200).json({ success: true, data });
+  } catch (err) {
+    console.error("[analyzeBatch] Batch analysis failed:", err.message);
+    return res.status(errorStatus(res, err)).json({ success: false, error: err.message });
+  }
+};
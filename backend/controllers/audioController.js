@@ -48,6 +48,7 @@ const uploadAudio = async (req, res) => {
       url: result.secure_url,
       public_id: result.public_id,
       original_filename: result.original_filename,
+      duration: result.duration,
     });
 
     const savedAudio = await newAudio.save();
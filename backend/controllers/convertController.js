@@ -1,84 +1,165 @@
 // backend/controllers/convertController.js
+const os = require("os");
+const net = require("net");
+const crypto = require("crypto");
 const path = require("path");
 const fs = require("fs").promises;
 const cloudinary = require("cloudinary").v2;
-const runPython = require("../utils/runPython.js");
+const PythonWorkerPool = require("../utils/pythonWorkerPool");
+const { getQueue, workersForShare, isAsyncRequest, sendAccepted, errorStatus } = require("../utils/jobQueue");
 const ConvertAudio = require("../models/ConvertAudio.js");
 
-const convertAudio = async (req, res) => {
-    console.log("[convertAudio] Incoming POST request to /convert with body:", req.body);
-    const { notes, instrument } = req.body;
-    const uploadsDir = path.resolve("uploads");
-    const midiPath = path.join(uploadsDir, "output.mid");
-    const wavPath = path.join(uploadsDir, "output.wav");
-    const scriptPath = path.join(__dirname, "../python/synth.py");
+// Resident synth.py workers; each job renders into its own directory under
+// uploads/, so conversions no longer have to be serialized.
+let synthPool = null;
 
-    console.log("[convertAudio] uploadsDir:", uploadsDir);
-    console.log("[convertAudio] midiPath:", midiPath);
-    console.log("[convertAudio] wavPath:", wavPath);
-    console.log("[convertAudio] scriptPath:", scriptPath);
-
-    const sanitizedNotes = notes.map(n => {
-        const noteObj = n.note ? n : { note: n.note_name, ...n };
-        return {
-            ...noteObj,
-            note: noteObj.note.replace(/♯/g, '#').replace(/♭/g, 'b'),
-            volume: Math.min(127, Math.max(1, Math.round(noteObj.volume || 100))),
-            vibrato: noteObj.vibrato || false,
-            breathy: noteObj.breathy || false,
-            confidence: noteObj.confidence || 1.0
-        };
+// Synthesis gets SYNTH_CPU_SHARE of the job core budget (see utils/jobQueue.js)
+const synthWorkers = () =>
+    workersForShare(Number(process.env.SYNTH_CPU_SHARE) || 0.5, process.env.SYNTH_WORKERS);
+
+const getSynthPool = () => {
+    if (!synthPool) {
+        const scriptPath = path.join(__dirname, "..", "python", "synth.py");
+        synthPool = new PythonWorkerPool(scriptPath, { size: synthWorkers() }).start();
+    }
+    return synthPool;
+};
+
+// Conversions and streams share one queue sized to the pool, shortest melodies first
+const getSynthQueue = () => getQueue("convert", {
+    concurrency: synthWorkers(),
+    maxQueued: Number(process.env.SYNTH_MAX_QUEUED) || 100
+});
+
+const renderSeconds = (notes) => notes.reduce((end, n) => Math.max(end, Number(n.end) || 0), 0);
+
+const CONTENT_TYPES = { wav: "audio/wav", opus: "audio/ogg", ogg: "audio/ogg", mp3: "audio/mpeg" };
+
+const sanitizeNotes = (notes) => notes.map(n => {
+    const noteObj = n.note ? n : { note: n.note_name, ...n };
+    return {
+        ...noteObj,
+        note: noteObj.note.replace(/♯/g, '#').replace(/♭/g, 'b'),
+        volume: Math.min(127, Math.max(1, Math.round(noteObj.volume || 100))),
+        vibrato: noteObj.vibrato || false,
+        breathy: noteObj.breathy || false,
+        confidence: noteObj.confidence || 1.0
+    };
+});
+
+const uploadAndSave = async (outputFile, instrument, tempo, sanitizedNotes) => {
+    const cloudinaryResult = await cloudinary.uploader.upload(outputFile, {
+        resource_type: "video", // Important for audio files on Cloudinary
+        folder: "hummify_audio",
     });
-    console.log("[convertAudio] sanitizedNotes:", sanitizedNotes);
+    console.log("[convertAudio] cloudinaryResult:", cloudinaryResult);
+
+    const audioDoc = await ConvertAudio.create({
+        notes: sanitizedNotes,
+        instrument,
+        cloudinaryUrl: cloudinaryResult.secure_url,
+        cloudinaryPublicId: cloudinaryResult.public_id, // ADDED THIS LINE: Save public_id
+        tempo: tempo || 120,
+        duration: cloudinaryResult.duration
+    });
+    console.log("[convertAudio] audioDoc created:", audioDoc);
+
+    return {
+        id: audioDoc._id,
+        instrument,
+        url: cloudinaryResult.secure_url,
+        cloudinaryPublicId: cloudinaryResult.public_id, // ADDED THIS LINE: Return public_id to frontend
+        tempo: audioDoc.tempo,
+        duration: audioDoc.duration
+    };
+};
+
+// Synth output encoding; compressed audio is roughly a tenth of the WAV size.
+// MP3 is the default because every browser plays it (older Safari/iOS cannot
+// play Ogg/Opus); requests can still ask for a format explicitly.
+const OUTPUT_FORMAT = process.env.SYNTH_OUTPUT_FORMAT || "mp3";
+const OUTPUT_BITRATE = process.env.SYNTH_OUTPUT_BITRATE || undefined;
 
+// Render in a synth worker, then upload every output; the job directory is
+// removed whatever happens.
+const renderAndUpload = async ({ sanitizedNotes, instrument, instruments, format, bitrate, uploadsDir }) => {
+    let jobDir = null;
     try {
         await fs.mkdir(uploadsDir, { recursive: true });
         console.log("[convertAudio] uploadsDir ensured.");
 
-        const result = await runPython(scriptPath, [instrument], sanitizedNotes);
+        const result = await getSynthPool().run({
+            notes: sanitizedNotes,
+            ...(instruments ? { instruments } : { instrument }),
+            format: format || OUTPUT_FORMAT,
+            bitrate: bitrate || OUTPUT_BITRATE,
+            output_root: uploadsDir
+        });
         console.log("[convertAudio] Python script result:", result);
+        jobDir = result.job_dir || null;
 
         if (result.status === "error") {
             throw new Error(`Python script error: ${result.message}`);
         }
 
-        const cloudinaryResult = await cloudinary.uploader.upload(wavPath, {
-            resource_type: "video", // Important for audio files on Cloudinary
-            folder: "hummify_audio",
-        });
-        console.log("[convertAudio] cloudinaryResult:", cloudinaryResult);
+        if (instruments) {
+            // One output per requested instrument; names for the same program
+            // share a file, which is uploaded once
+            const uploads = new Map();
+            return await Promise.all(result.outputs.map(async output => {
+                if (!uploads.has(output.output_file)) {
+                    uploads.set(output.output_file,
+                        uploadAndSave(output.output_file, output.instrument, output.tempo, sanitizedNotes));
+                }
+                return { ...(await uploads.get(output.output_file)), instrument: output.instrument };
+            }));
+        }
+        return await uploadAndSave(result.output_file, instrument, result.tempo, sanitizedNotes);
+    } finally {
+        if (jobDir) {
+            await fs.rm(jobDir, { recursive: true, force: true }).catch(() => { });
+            console.log("[convertAudio] Job directory cleaned up:", jobDir);
+        }
+    }
+};
 
-        const audioDoc = await ConvertAudio.create({
-            notes: sanitizedNotes,
+// POST /convert with { notes, instrument } renders one file; with
+// { notes, instruments: [...] } every instrument is rendered in a single
+// synth job and the response data is an array in the same order. Add
+// async: true to get a job id back at once and poll /api/audio/jobs/:id.
+const convertAudio = async (req, res) => {
+    console.log("[convertAudio] Incoming POST request to /convert with body:", req.body);
+    const { notes, instrument, instruments, format, bitrate } = req.body;
+    const multi = Array.isArray(instruments) && instruments.length > 0;
+    const uploadsDir = path.resolve("uploads");
+    console.log("[convertAudio] uploadsDir:", uploadsDir);
+
+    const sanitizedNotes = sanitizeNotes(notes);
+    console.log("[convertAudio] sanitizedNotes:", sanitizedNotes);
+
+    try {
+        const queue = getSynthQueue();
+        const job = queue.submit(() => renderAndUpload({
+            sanitizedNotes,
             instrument,
-            cloudinaryUrl: cloudinaryResult.secure_url,
-            cloudinaryPublicId: cloudinaryResult.public_id, // ADDED THIS LINE: Save public_id
-            tempo: result.tempo || 120,
-            duration: cloudinaryResult.duration
-        });
-        console.log("[convertAudio] audioDoc created:", audioDoc);
-
-        await Promise.allSettled([
-            fs.unlink(midiPath),
-            fs.unlink(wavPath),
-            fs.unlink(path.join(uploadsDir, "raw_output.wav")).catch(() => { }) // Catch to prevent error if file doesn't exist
-        ]);
-        console.log("[convertAudio] Temporary files cleaned up.");
-
-        res.json({
-            success: true,
-            data: {
-                id: audioDoc._id,
-                url: cloudinaryResult.secure_url,
-                cloudinaryPublicId: cloudinaryResult.public_id, // ADDED THIS LINE: Return public_id to frontend
-                tempo: audioDoc.tempo,
-                duration: audioDoc.duration
-            }
+            instruments: multi ? instruments : null,
+            format,
+            bitrate,
+            uploadsDir
+        }), {
+            priority: renderSeconds(sanitizedNotes) * (multi ? instruments.length : 1),
+            meta: { instrument: multi ? instruments : instrument }
         });
+        if (isAsyncRequest(req)) {
+            return sendAccepted(res, queue, job);
+        }
+
+        const data = await job.promise;
+        res.json({ success: true, data });
 
     } catch (err) {
         console.error("[convertAudio] error:", err);
-        res.status(500).json({
+        res.status(errorStatus(res, err)).json({
             success: false,
             error: err.message || "Audio conversion failed",
             details: err.response?.data || err.stack
@@ -86,5 +167,62 @@ const convertAudio = async (req, res) => {
     }
 };
 
-module.exports = { convertAudio };
+// POST /convert/stream renders { notes, instrument } block by block and pipes
+// the encoded audio into the response while it is produced, so playback can
+// start right away. Nothing is uploaded or saved. The synth worker connects
+// to a per-request Unix socket and writes the audio there.
+const streamConvert = async (req, res) => {
+    const { notes, instrument, format, bitrate } = req.body;
+    const outputFormat = format || OUTPUT_FORMAT;
+    if (!Array.isArray(notes) || !notes.length) {
+        return res.status(400).json({ success: false, error: "notes are required" });
+    }
+    if (!CONTENT_TYPES[outputFormat]) {
+        return res.status(400).json({ success: false, error: `Unknown output format: ${outputFormat}` });
+    }
+
+    const socketPath = path.join(os.tmpdir(), `hummify-synth-${crypto.randomUUID()}.sock`);
+    const server = net.createServer((socket) => {
+        console.log("[streamConvert] Synth worker connected, streaming", outputFormat);
+        res.setHeader("Content-Type", CONTENT_TYPES[outputFormat]);
+        res.setHeader("Cache-Control", "no-store");
+        socket.pipe(res);
+        // Stop rendering if the client goes away
+        res.on("close", () => socket.destroy());
+    });
+
+    try {
+        await new Promise((resolve, reject) => {
+            server.once("error", reject);
+            server.listen(socketPath, resolve);
+        });
+
+        const sanitizedNotes = sanitizeNotes(notes);
+        const job = getSynthQueue().submit(() => getSynthPool().run({
+            notes: sanitizedNotes,
+            instrument,
+            format: outputFormat,
+            bitrate: bitrate || OUTPUT_BITRATE,
+            stream_socket: socketPath
+        }), { priority: renderSeconds(sanitizedNotes), meta: { instrument, stream: true } });
+        const result = await job.promise;
+        console.log("[streamConvert] Python script result:", result);
+
+        if (result.status === "error") {
+            throw new Error(`Python script error: ${result.message}`);
+        }
+    } catch (err) {
+        console.error("[streamConvert] error:", err);
+        if (!res.headersSent) {
+            res.status(errorStatus(res, err)).json({ success: false, error: err.message || "Audio streaming failed" });
+        } else {
+            res.destroy(err);
+        }
+    } finally {
+        server.close();
+        await fs.rm(socketPath, { force: true }).catch(() => { });
+    }
+};
+
+module.exports = { convertAudio, streamConvert };
 
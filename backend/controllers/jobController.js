@@ -0,0 +1,17 @@
+// backend/controllers/jobController.js
+const { findJob, queueStats } = require("../utils/jobQueue");
+
+// GET /api/audio/jobs/:id - status of a queued analyze or convert job; the
+// response data carries the result once status is "done".
+exports.getJob = (req, res) => {
+  const found = findJob(req.params.id);
+  if (!found) {
+    return res.status(404).json({ success: false, error: "Job not found or expired" });
+  }
+  return res.status(200).json({ success: true, data: found.queue.describe(found.job) });
+};
+
+// GET /api/audio/jobs/metrics - queue depth, concurrency and wait/run times
+exports.getJobMetrics = (req, res) => {
+  return res.status(200).json({ success: true, data: queueStats() });
+};
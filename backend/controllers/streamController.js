@@ -0,0 +1,195 @@
+// backend/controllers/streamController.js
+const crypto = require("crypto");
+const fs = require("fs/promises");
+const net = require("net");
+const os = require("os");
+const path = require("path");
+const readline = require("readline");
+const PythonWorkerPool = require("../utils/pythonWorkerPool");
+const { getQueue, workersForShare, errorStatus } = require("../utils/jobQueue");
+
+// Live transcription sessions: the client uploads MediaRecorder chunks in
+// order and each response carries the notes finalized since the last call.
+//
+// Each session is a job on the stream queue, served by a warm audiotonotes.py
+// worker over a per-session Unix socket. A session holds its worker for the
+// whole take, so sessions get their own small pool (STREAM_WORKERS, default
+// one) instead of taking analysis workers away from queued recordings; past
+// that, sessions wait in the queue and chunks that arrive before a worker
+// picks the session up are held here.
+let streamPool = null;
+
+// Streaming gets STREAM_CPU_SHARE of the job core budget (see utils/jobQueue.js)
+const streamWorkers = () =>
+  workersForShare(Number(process.env.STREAM_CPU_SHARE) || 0.1, process.env.STREAM_WORKERS);
+
+const getStreamPool = () => {
+  if (!streamPool) {
+    const scriptPath = path.join(__dirname, "..", "python", "audiotonotes.py");
+    // The streaming defaults never call CREPE, so skip preloading the model
+    streamPool = new PythonWorkerPool(scriptPath, {
+      size: streamWorkers(),
+      args: ["--crepe-backend", "process"],
+    }).start();
+  }
+  return streamPool;
+};
+
+const getStreamQueue = () => getQueue("stream", {
+  concurrency: streamWorkers(),
+  maxQueued: Number(process.env.STREAM_MAX_QUEUED) || 4,
+});
+
+const sessions = new Map();
+const SESSION_IDLE_MS = 2 * 60 * 1000;
+const SESSION_MAX_MS = (Number(process.env.STREAM_MAX_SECONDS) || 15 * 60) * 1000;
+
+const drainNotes = (session) => {
+  const notes = session.notes;
+  session.notes = [];
+  return notes;
+};
+
+const closeSession = (id) => {
+  const session = sessions.get(id);
+  if (!session) return;
+  sessions.delete(id);
+  if (session.socket) {
+    session.socket.destroy();
+  }
+  session.server.close();
+};
+
+setInterval(() => {
+  const now = Date.now();
+  for (const [id, session] of sessions) {
+    if (now - session.lastSeen > SESSION_IDLE_MS) {
+      console.log(`[stream] Closing idle session ${id}`);
+      closeSession(id);
+    }
+  }
+}, 30 * 1000).unref();
+
+const attachWorker = (id, session, socket) => {
+  console.log(`[stream] Worker connected to session ${id}`);
+  session.socket = socket;
+  const lines = readline.createInterface({ input: socket });
+  lines.on("line", (line) => {
+    if (!line.trim()) return;
+    let message;
+    try {
+      message = JSON.parse(line);
+    } catch (e) {
+      console.error(`[stream] Non-JSON line from session ${id}:`, line);
+      return;
+    }
+    if (message.notes) session.notes.push(...message.notes);
+    if (message.done) session.done = true;
+  });
+  // readline re-emits socket errors (e.g. ECONNRESET when the worker fails
+  // mid-take) and would crash the server without a listener; the socket
+  // handler logs them and the job result reports the failure
+  lines.on("error", () => { });
+  socket.on("error", (err) => {
+    console.error(`[stream] Session ${id} socket error:`, err.message);
+  });
+
+  for (const chunk of session.buffered) {
+    socket.write(chunk);
+  }
+  session.buffered = [];
+  if (session.ended) {
+    socket.end();
+  }
+};
+
+const startStream = async (req, res) => {
+  const id = crypto.randomUUID();
+  const socketPath = path.join(os.tmpdir(), `hummify-stream-${id}.sock`);
+  const session = {
+    socket: null,
+    buffered: [],
+    ended: false,
+    notes: [],
+    done: false,
+    error: null,
+    lastSeen: Date.now(),
+  };
+  session.server = net.createServer((socket) => attachWorker(id, session, socket));
+
+  try {
+    await new Promise((resolve, reject) => {
+      session.server.once("error", reject);
+      session.server.listen(socketPath, resolve);
+    });
+
+    session.job = getStreamQueue().submit(() => getStreamPool().run(
+      { stream_socket: socketPath },
+      { timeoutMs: SESSION_MAX_MS }
+    ), { priority: 0, meta: { stream: id } });
+
+    session.finished = session.job.promise
+      .then((result) => {
+        if (!result.success) session.error = result.error || "Streaming transcription failed";
+      }, (err) => {
+        session.error = err.message;
+      })
+      .finally(() => {
+        session.done = true;
+        session.server.close();
+        return fs.rm(socketPath, { force: true }).catch(() => { });
+      });
+  } catch (err) {
+    console.error("[stream] Failed to start session:", err.message);
+    session.server.close();
+    await fs.rm(socketPath, { force: true }).catch(() => { });
+    return res.status(errorStatus(res, err)).json({ success: false, error: err.message });
+  }
+
+  sessions.set(id, session);
+  console.log(`[stream] Started session ${id} (job ${session.job.id}, ${session.job.status})`);
+  res.status(201).json({ success: true, sessionId: id, status: session.job.status });
+};
+
+const pushStreamChunk = (req, res) => {
+  const session = sessions.get(req.params.id);
+  if (!session) {
+    return res.status(404).json({ success: false, error: "Unknown stream session" });
+  }
+  if (session.error) {
+    closeSession(req.params.id);
+    return res.status(500).json({ success: false, error: session.error });
+  }
+  if (!Buffer.isBuffer(req.body) || !req.body.length) {
+    return res.status(400).json({ success: false, error: "Audio chunk body is required" });
+  }
+
+  session.lastSeen = Date.now();
+  if (session.socket) {
+    session.socket.write(req.body);
+  } else {
+    session.buffered.push(req.body);
+  }
+  res.json({ success: true, status: session.job.status, notes: drainNotes(session) });
+};
+
+const endStream = async (req, res) => {
+  const session = sessions.get(req.params.id);
+  if (!session) {
+    return res.status(404).json({ success: false, error: "Unknown stream session" });
+  }
+
+  session.ended = true;
+  if (session.socket) {
+    session.socket.end();
+  }
+  await session.finished;
+  sessions.delete(req.params.id);
+
+  if (session.error) {
+    return res.status(500).json({ success: false, error: session.error, notes: drainNotes(session) });
+  }
+  res.json({ success: true, done: true, notes: drainNotes(session) });
+};
+
+module.exports = { startStream, pushStreamChunk, endStream };
@@ -16,6 +16,9 @@ const audioSchema = new mongoose.Schema(
       type: String,
       required: true, // e.g., recording_1749405072714.webm
     },
+    duration: {
+      type: Number, // seconds, as measured by Cloudinary; lets analysis jobs be prioritized
+    },
   },
   {
     timestamps: true, // Adds createdAt and updatedAt fields automatically
@@ -0,0 +1,103 @@
+"""In-memory versions of the ffmpeg post-processing chain used for synthesized audio.
+
+    equalizer=f=1000:width_type=h:width=2000:g=5,
+    compand=attacks=0.1:decays=0.4:points=-80/-80|-30/-10|0/0
+
+Both effects keep their state between calls, so a signal can be processed
+in consecutive blocks with the same result as processing it whole.
+"""
+import numpy as np
+from scipy.signal import sosfilt
+
+class PeakingEQ:
+    """RBJ peaking biquad, with bandwidth given in Hz like ffmpeg's width_type=h"""
+
+    def __init__(self, sr, frequency=1000.0, width_hz=2000.0, gain_db=5.0):
+        w0 = 2 * np.pi * frequency / sr
+        alpha = np.sin(w0) / (2 * frequency / width_hz)
+        A = 10 ** (gain_db / 40)
+        b = [1 + alpha * A, -2 * np.cos(w0), 1 - alpha * A]
+        a = [1 + alpha / A, -2 * np.cos(w0), 1 - alpha / A]
+        self.sos = np.array([b + a]) / a[0]
+        self.zi = np.zeros((1, 2))
+
+    def process(self, block):
+        if not len(block):
+            return np.zeros(0)
+        out, self.zi = sosfilt(self.sos, block, zi=self.zi)
+        return out
+
+class Compander:
+    """Envelope-following compressor/expander evaluated on short blocks.
+
+    The envelope follows the block peak with separate attack and decay
+    time constants (as ffmpeg's compand does per sample), the gain comes
+    from the piecewise-linear dB transfer curve `points`, and it is
+    interpolated back to sample rate so there are no steps between blocks.
+    """
+
+    def __init__(self, sr, attack=0.1, decay=0.4, points=((-80, -80), (-30, -10), (0, 0)),
+                 block_size=256, initial_db=0.0):
+        block_rate = sr / block_size
+        self.block_size = block_size
+        self.attack = 1 - np.exp(-1 / (block_rate * attack))
+        self.decay = 1 - np.exp(-1 / (block_rate * decay))
+        points = np.asarray(points, dtype=float)
+        self.curve_in, self.curve_out = points[:, 0], points[:, 1]
+        self.volume = 10 ** (initial_db / 20)
+        self.last_gain = None
+        self.pending = np.zeros(0)
+
+    def gain_db(self, level_db):
+        """Transfer curve as gain; unity outside the defined points"""
+        out = np.interp(level_db, self.curve_in, self.curve_out)
+        return np.where((level_db < self.curve_in[0]) | (level_db > self.curve_in[-1]), 0.0, out - level_db)
+
+    def process(self, block, final=True):
+        """Compand a block; with final=False a trailing partial block is held back"""
+        samples = np.concatenate([self.pending, block])
+        n_blocks = len(samples) // self.block_size
+        if final and len(samples) % self.block_size:
+            n_blocks += 1
+        usable = min(len(samples), n_blocks * self.block_size)
+        self.pending = samples[usable:]
+        samples = samples[:usable]
+        if not n_blocks:
+            return samples
+
+        padded = np.zeros(n_blocks * self.block_size)
+        padded[:usable] = np.abs(samples)
+        peaks = padded.reshape(n_blocks, self.block_size).max(axis=1)
+
+        levels = np.empty(n_blocks)
+        volume, attack, decay = self.volume, self.attack, self.decay
+        for i, peak in enumerate(peaks.tolist()):
+            volume += (peak - volume) * (attack if peak > volume else decay)
+            levels[i] = volume
+        self.volume = volume
+
+        gains = 10 ** (self.gain_db(20 * np.log10(np.maximum(levels, 1e-9))) / 20)
+        # Ramp from the previous block's gain to each block's gain
+        start = gains[0] if self.last_gain is None else self.last_gain
+        ramp_from = np.concatenate([[start], gains[:-1]])
+        t = (np.arange(self.block_size) + 1) / self.block_size
+        envelope = (ramp_from[:, None] + (gains - ramp_from)[:, None] * t).ravel()[:usable]
+        self.last_gain = gains[-1]
+        return samples * envelope
+
+class PostProcessor:
+    """EQ then compand, as one stateful chain"""
+
+    def __init__(self, sr):
+        self.eq = PeakingEQ(sr)
+        self.compander = Compander(sr)
+
+    def process(self, block, final=True):
+        return self.compander.process(self.eq.process(block), final=final)
+
+def post_process_blocks(blocks, sr):
+    """Apply the whole chain to consecutive mono blocks, yielding clipped output blocks"""
+    processor = PostProcessor(sr)
+    for block in blocks:
+        yield np.clip(processor.process(block, final=False), -1.0, 1.0)
+    yield np.clip(processor.process(np.zeros(0), final=True), -1.0, 1.0)
@@ -1,19 +1,29 @@
 import librosa
 import numpy as np
+import soundfile as sf
 import argparse
 import json
 import tempfile
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import os
 import subprocess
-from scipy.signal import savgol_filter, find_peaks, medfilt
+from scipy.signal import savgol_filter, find_peaks, medfilt, resample_poly
+from scipy.ndimage import convolve1d
 import crepe
+import resampy
 import noisereduce as nr
 import sys
 import traceback
 import logging
 import multiprocessing
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
 import tensorflow as tf
+from disk_cache import DiskLRUCache, hash_key
+from notes import NOTE_DTYPE, empty_notes, note_name, notes_to_dicts, scale_pitches, snap_to_scale
+from timing import StageTimer, append_metrics, maybe_profile, timed
 
 # Configure detailed logging
 logging.basicConfig(
@@ -29,15 +39,166 @@ warnings.filterwarnings("ignore")
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
 tf.get_logger().setLevel('ERROR')
 
+CREPE_MODEL_CAPACITIES = ("tiny", "small", "medium", "large", "full")
+# fast = PYIN only, adaptive = CREPE only where PYIN is unsure, full = CREPE everywhere
+QUALITY_TIERS = ("fast", "adaptive", "full")
+
+# Per-request pipeline options; worker jobs and CLI flags override these
+DEFAULT_OPTIONS = {
+    "model_capacity": "medium",
+    "crepe_backend": "inprocess",
+    "crepe_timeout": 45,
+    "fusion": "weighted",
+    "cache": True,
+    "ingest": "stream",
+    "profile": False,
+    "corrections": None,
+    "denoise": "noisereduce",
+    "chunk_seconds": 60,
+    "quality": "adaptive",
+    "pitch_tracker": "pyin",
+}
+
+TARGET_SR = 22050
+HOP_LENGTH = 256
+FRAME_LENGTH = 1024
+
+CORRECTION_PARAMS = {
+    "min_gap": 0.05,
+    "min_duration": 0.08,
+    "max_pitch_diff": 0.5,
+    "min_volume_diff": 10,
+    "fill_gap": 0.0,
+    "key": None,
+}
+
+# "adaptive" quality runs CREPE on runs of audible frames (RMS >= min_rms)
+# whose PYIN confidence is below min_confidence, padded by pad_seconds; past
+# max_fraction of the clip it just runs CREPE on everything
+ADAPTIVE_CREPE_PARAMS = {
+    "min_confidence": 0.6,
+    "min_rms": 0.01,
+    "min_run_seconds": 0.06,
+    "pad_seconds": 0.03,
+    "max_fraction": 0.5,
+}
+
+# noisereduce works through long signals in chunks of this many seconds
+DENOISE_CHUNK_SECONDS = 30
+DENOISE_MODES = ("off", "spectral", "noisereduce")
+
+DOWNLOAD_CHUNK_BYTES = 64 * 1024
+DECODE_BLOCK_BYTES = 64 * 1024
+# Decoded signals longer than this are kept in a memory-mapped temp file
+SPILL_PCM_SECONDS = 120
+
+# Long recordings are analyzed in windows of chunk_seconds (see
+# transcribe_chunked), each padded by this much context on either side
+CHUNK_OVERLAP_SECONDS = 2.0
+
+# Only these options change the notes, so only they go into the cache key
+RESULT_KEY_OPTIONS = (
+    "model_capacity", "fusion", "corrections", "denoise", "chunk_seconds", "quality", "pitch_tracker"
+)
+
+# Edits to this file or to note spelling and scale snapping (notes.py)
+# invalidate previously cached results
+_CODE_VERSION_FILES = (__file__, os.path.join(os.path.dirname(os.path.abspath(__file__)), "notes.py"))
+
+def _read_bytes(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+CODE_VERSION = hash_key(*(_read_bytes(path) for path in _CODE_VERSION_FILES))[:16]
+
+RESULT_CACHE_DIR = os.environ.get(
+    "ANALYSIS_CACHE_DIR", os.path.join(tempfile.gettempdir(), "hummify-analysis-cache")
+)
+RESULT_CACHE_MAX_MB = float(os.environ.get("ANALYSIS_CACHE_MAX_MB", "256"))
+
+# Per-request stage timings are appended here as JSON lines when set
+METRICS_FILE = os.environ.get("ANALYSIS_METRICS_FILE", "")
+PROFILE_DIR = os.environ.get(
+    "ANALYSIS_PROFILE_DIR", os.path.join(tempfile.gettempdir(), "hummify-profiles")
+)
+
+_crepe_executor = None
+_crepe_abandoned = None
+_result_cache = None
+_http_session = None
+
+def resolve_options(options=None):
+    """Merge request options over the defaults and validate them"""
+    resolved = dict(DEFAULT_OPTIONS)
+    for key, value in (options or {}).items():
+        if key not in DEFAULT_OPTIONS:
+            raise ValueError(f"Unknown analysis option: {key}")
+        if value is not None:
+            resolved[key] = value
+
+    if resolved["model_capacity"] not in CREPE_MODEL_CAPACITIES:
+        raise ValueError(f"Unknown CREPE model capacity: {resolved['model_capacity']}")
+    if resolved["crepe_backend"] not in ("inprocess", "process"):
+        raise ValueError(f"Unknown CREPE backend: {resolved['crepe_backend']}")
+    if resolved["ingest"] not in ("stream", "file"):
+        raise ValueError(f"Unknown ingest mode: {resolved['ingest']}")
+    if resolved["fusion"] not in FUSION_STRATEGIES:
+        raise ValueError(f"Unknown pitch fusion strategy: {resolved['fusion']}")
+    if resolved["pitch_tracker"] not in PITCH_TRACKERS:
+        raise ValueError(f"Unknown pitch tracker: {resolved['pitch_tracker']}")
+    if resolved["quality"] not in QUALITY_TIERS:
+        raise ValueError(f"Unknown quality tier: {resolved['quality']}")
+    if resolved["denoise"] not in DENOISE_MODES:
+        raise ValueError(f"Unknown denoise mode: {resolved['denoise']}")
+    resolved["crepe_timeout"] = float(resolved["crepe_timeout"])
+    resolved["chunk_seconds"] = float(resolved["chunk_seconds"])
+    if resolved["chunk_seconds"] < 0:
+        raise ValueError("chunk_seconds must be >= 0")
+    resolved["corrections"] = resolve_corrections(resolved["corrections"])
+    return resolved
+
+def get_result_cache():
+    """Process-wide analysis result cache, or None when disabled"""
+    global _result_cache
+    if _result_cache is None and RESULT_CACHE_MAX_MB > 0:
+        _result_cache = DiskLRUCache(RESULT_CACHE_DIR, int(RESULT_CACHE_MAX_MB * 1024 * 1024), ".json")
+    return _result_cache
+
+def _result_key(audio_digest, options):
+    params = {name: options[name] for name in RESULT_KEY_OPTIONS}
+    params.update(sr=TARGET_SR, hop_length=HOP_LENGTH, frame_length=FRAME_LENGTH)
+    return hash_key("result", audio_digest, params, CODE_VERSION)
+
+def _get_cached_result(cache, audio_digest, options):
+    data = cache.get(_result_key(audio_digest, options))
+    if data is None:
+        return None
+    result = json.loads(data)
+    result["cache"] = dict(cache.stats(), hit=True)
+    logger.info(f"Result cache hit: {len(result['notes'])} notes")
+    return result
+
+def get_http_session():
+    """Shared requests session so a long-running worker reuses connections"""
+    global _http_session
+    if _http_session is None:
+        retry = Retry(total=3, backoff_factor=0.5, status_forcelist=(502, 503, 504),
+                      allowed_methods=("GET",))
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=4, max_retries=retry)
+        _http_session = requests.Session()
+        _http_session.mount("http://", adapter)
+        _http_session.mount("https://", adapter)
+    return _http_session
+
 def download_audio(url, path):
     """Download audio with retries and progress tracking"""
     try:
         logger.info(f"Downloading audio from: {url}")
-        response = requests.get(url, stream=True, timeout=15)
+        response = get_http_session().get(url, stream=True, timeout=15)
         response.raise_for_status()
         
         with open(path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_BYTES):
                 f.write(chunk)
         
         file_size = os.path.getsize(path) / 1024
@@ -47,40 +208,231 @@ def download_audio(url, path):
         logger.error(f"Download failed: {str(e)}")
         return False
 
-def convert_to_wav(input_path, output_path):
-    """Convert audio to WAV format using ffmpeg with optimized parameters"""
+def stream_decode_url(url, target_sr=TARGET_SR):
+    """Download and decode concurrently, feeding bytes to ffmpeg as they arrive.
+
+    A feeder thread pushes the HTTP body into ffmpeg's stdin while this
+    thread reads decoded float PCM from its stdout, so network time overlaps
+    with decode time. The compressed bytes are kept, and if ffmpeg cannot
+    decode the container from a pipe (e.g. MP4 with a trailing moov atom)
+    they are written to a temp file and decoded with decode_audio instead.
+    """
+    logger.info(f"Streaming audio from: {url}")
+    response = get_http_session().get(url, stream=True, timeout=15)
+    response.raise_for_status()
+
+    process = subprocess.Popen([
+        "ffmpeg", "-v", "error", "-i", "pipe:0",
+        "-ac", "1", "-ar", str(target_sr), "-f", "f32le", "pipe:1"
+    ], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    received = []
+    download_errors = []
+
+    def feed():
+        ffmpeg_open = True
+        try:
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_BYTES):
+                received.append(chunk)
+                if ffmpeg_open:
+                    try:
+                        process.stdin.write(chunk)
+                    except BrokenPipeError:
+                        # ffmpeg gave up; keep downloading for the file fallback
+                        ffmpeg_open = False
+        except Exception as e:
+            download_errors.append(e)
+        finally:
+            response.close()
+            try:
+                process.stdin.close()
+            except BrokenPipeError:
+                pass
+
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+    y, stderr = _read_pcm(process)
+    feeder.join()
+
+    if download_errors:
+        raise RuntimeError(f"Audio download failed: {download_errors[0]}")
+
+    size_kb = sum(len(chunk) for chunk in received) / 1024
+    if process.returncode == 0:
+        logger.info(f"Streamed {size_kb:.1f} KB, decoded {len(y)} samples")
+        return y, target_sr
+
+    logger.warning(f"Streaming decode failed, retrying from file: {stderr.decode(errors='replace')}")
+    ext = os.path.splitext(url.split("?")[0])[1] or ".webm"
+    with tempfile.TemporaryDirectory() as tmpdir:
+        input_path = os.path.join(tmpdir, f"input{ext}")
+        with open(input_path, "wb") as f:
+            for chunk in received:
+                f.write(chunk)
+        return decode_audio(input_path, target_sr)
+
+class PCMBuffer:
+    """Collects decoded float32 PCM bytes.
+
+    Short signals stay in memory. Once more than spill_bytes arrive the data
+    moves to an unlinked temp file that is read back as a read-only memory
+    map, so long recordings are paged in on demand instead of being held in
+    RAM for the whole analysis.
+    """
+
+    def __init__(self, spill_bytes=None):
+        self.spill_bytes = SPILL_PCM_SECONDS * TARGET_SR * 4 if spill_bytes is None else spill_bytes
+        self.blocks = []
+        self.size = 0
+        self.file = None
+
+    def write(self, data):
+        self.size += len(data)
+        if self.file is None and self.size > self.spill_bytes:
+            self.file = tempfile.TemporaryFile(prefix="hummify-pcm-")
+            for block in self.blocks:
+                self.file.write(block)
+            self.blocks = []
+        if self.file is not None:
+            self.file.write(data)
+        else:
+            self.blocks.append(data)
+
+    def to_array(self):
+        n_samples = self.size // 4
+        if self.file is None:
+            return np.frombuffer(b"".join(self.blocks), dtype=np.float32, count=n_samples)
+
+        self.file.flush()
+        y = np.memmap(self.file, dtype=np.float32, mode="r", shape=(n_samples,))
+        # The mapping keeps the unlinked file alive after the handle is closed
+        self.file.close()
+        logger.info(f"Decoded audio spilled to a memory-mapped file ({self.size / 2**20:.1f} MB)")
+        return y
+
+def _read_pcm(process):
+    """Drain an ffmpeg f32le stdout into a PCMBuffer; returns (samples, stderr)"""
+    stderr_chunks = []
+    stderr_reader = threading.Thread(
+        target=lambda: stderr_chunks.append(process.stderr.read()), daemon=True
+    )
+    stderr_reader.start()
+
+    pcm = PCMBuffer()
+    while True:
+        data = process.stdout.read(DECODE_BLOCK_BYTES)
+        if not data:
+            break
+        pcm.write(data)
+
+    process.wait()
+    stderr_reader.join()
+    return pcm.to_array(), b"".join(stderr_chunks)
+
+def decode_audio(input_path, target_sr=TARGET_SR):
+    """Decode audio straight into a mono float32 array at target_sr.
+
+    Formats libsndfile understands (WAV, FLAC, OGG...) are read directly,
+    block by block when already at target_sr; anything else (e.g. the
+    recorder's WebM/Opus) and long files needing resampling are piped
+    through ffmpeg as raw float PCM. Long signals come back memory-mapped
+    (see PCMBuffer).
+    """
     try:
-        logger.info(f"Converting to WAV: {input_path} → {output_path}")
-        result = subprocess.run([
-            "ffmpeg", "-y", "-i", input_path,
-            "-ac", "1", "-ar", "22050", "-acodec", "pcm_s16le",
-            output_path
-        ], capture_output=True, text=True)
-        
-        if result.returncode != 0:
-            logger.error(f"FFmpeg conversion failed: {result.stderr}")
-            return False
-        
-        wav_size = os.path.getsize(output_path) / 1024
-        logger.info(f"Conversion complete. WAV size: {wav_size:.1f} KB")
-        return True
+        info = sf.info(input_path)
+    except RuntimeError:
+        # libsndfile cannot read this container; fall back to ffmpeg
+        info = None
+
+    if info is not None and info.samplerate == target_sr:
+        pcm = PCMBuffer()
+        # soundfile's blocksize counts frames, each channels x float32 wide
+        block_frames = max(1, DECODE_BLOCK_BYTES // (info.channels * np.dtype(np.float32).itemsize))
+        for block in sf.blocks(input_path, blocksize=block_frames, dtype="float32", always_2d=True):
+            pcm.write(block.mean(axis=1, dtype=np.float32).tobytes())
+        y = pcm.to_array()
+        logger.info(f"Decoded with soundfile: {len(y)} samples")
+        return y, target_sr
+
+    if info is not None and info.frames <= SPILL_PCM_SECONDS * info.samplerate:
+        y, sr = sf.read(input_path, dtype="float32", always_2d=True)
+        y = librosa.resample(y.mean(axis=1), orig_sr=sr, target_sr=target_sr)
+        logger.info(f"Decoded with soundfile: {len(y)} samples")
+        return y, target_sr
+
+    logger.info(f"Decoding with ffmpeg: {input_path}")
+    process = subprocess.Popen([
+        "ffmpeg", "-v", "error", "-i", input_path,
+        "-ac", "1", "-ar", str(target_sr), "-f", "f32le", "-"
+    ], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    y, stderr = _read_pcm(process)
+
+    if process.returncode != 0:
+        raise RuntimeError(f"FFmpeg decode failed: {stderr.decode(errors='replace')}")
+
+    logger.info(f"Decoded with ffmpeg: {len(y)} samples")
+    return y, target_sr
+
+def load_crepe_model(model_capacity="medium"):
+    """Build the CREPE model once; crepe keeps it cached per capacity"""
+    if model_capacity not in CREPE_MODEL_CAPACITIES:
+        raise ValueError(f"Unknown CREPE model capacity: {model_capacity}")
+    return crepe.core.build_and_load_model(model_capacity)
+
+def _get_crepe_executor():
+    global _crepe_executor
+    if _crepe_executor is None:
+        _crepe_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="crepe")
+    return _crepe_executor
+
+def run_crepe(y, sr, step_size, model_capacity="medium", backend="inprocess", timeout=45):
+    """Run CREPE with a watchdog timeout.
+
+    The "inprocess" backend reuses the resident model and runs on a helper
+    thread; "process" is the old spawn-per-clip path, kept as a fallback.
+    """
+    global _crepe_executor, _crepe_abandoned
+    if _crepe_abandoned is not None and _crepe_abandoned.done():
+        _crepe_abandoned = None
+    if backend == "process" or _crepe_abandoned is not None:
+        # While a timed-out call is still busy on its thread, later clips
+        # use a subprocess instead of sharing the model with it
+        return _run_crepe_subprocess(y, sr, step_size, model_capacity, timeout)
+
+    try:
+        load_crepe_model(model_capacity)
+        future = _get_crepe_executor().submit(
+            crepe.predict, y, sr, viterbi=True, model_capacity=model_capacity,
+            step_size=step_size, center=True, verbose=0
+        )
+        times_crepe, f0_crepe, confidence, _ = future.result(timeout=timeout)
+        return times_crepe, f0_crepe, confidence, None
+
+    except FuturesTimeoutError:
+        # The thread cannot be killed; leave it to finish on the old executor
+        # so the next clip does not queue behind it and inherit its delay
+        logger.warning(f"CREPE timed out after {timeout} seconds")
+        _crepe_abandoned = future
+        _crepe_executor.shutdown(wait=False)
+        _crepe_executor = None
+        return None, None, None, None
     except Exception as e:
-        logger.error(f"Conversion error: {str(e)}")
-        return False
+        logger.error(f"CREPE processing failed: {str(e)}")
+        return None, None, None, None
 
-def run_crepe(y, sr, step_size):
-    """Run CREPE in a separate process with timeout and medium model"""
+def _run_crepe_subprocess(y, sr, step_size, model_capacity, timeout):
+    """Run CREPE in a separate process with timeout"""
     try:
         queue = multiprocessing.Queue()
         process = multiprocessing.Process(
             target=_crepe_worker,
-            args=(y, sr, step_size, queue)
+            args=(y, sr, step_size, model_capacity, queue)
         )
         process.start()
-        process.join(timeout=45)
+        process.join(timeout=timeout)
         
         if process.is_alive():
-            logger.warning("CREPE timed out after 45 seconds")
+            logger.warning(f"CREPE timed out after {timeout} seconds")
             process.terminate()
             process.join()
             return None, None, None, None
@@ -95,11 +447,11 @@ def run_crepe(y, sr, step_size):
         logger.error(f"CREPE processing failed: {str(e)}")
         return None, None, None, None
 
-def _crepe_worker(y, sr, step_size, queue):
-    """Worker function for CREPE processing with medium model"""
+def _crepe_worker(y, sr, step_size, model_capacity, queue):
+    """Worker function for CREPE processing"""
     try:
         times_crepe, f0_crepe, confidence, _ = crepe.predict(
-            y, sr, viterbi=True, model_capacity="medium",
+            y, sr, viterbi=True, model_capacity=model_capacity,
             step_size=step_size, center=True, verbose=0
         )
         queue.put((times_crepe, f0_crepe, confidence, None))
@@ -107,59 +459,368 @@ def _crepe_worker(y, sr, step_size, queue):
         logger.error(f"CREPE error in worker: {str(e)}")
         queue.put((None, None, None, str(e)))
 
-def get_vocal_pitch(y, sr, frame_length=1024, hop_length=256):
-    """Optimized hybrid pitch detection with reduced computational load"""
+def crepe_step_size_ms(sr, hop_length=HOP_LENGTH):
+    """CREPE step size matching the analysis hop"""
+    return int(round(1000 * hop_length / sr))
+
+def _crepe_frames(y, sr, step_size):
+    """Frame and normalize a signal exactly as crepe.core.get_activation does"""
+    audio = y.astype(np.float32)
+    if sr != crepe.core.model_srate:
+        audio = resampy.resample(audio, sr, crepe.core.model_srate)
+    audio = np.pad(audio, 512, mode='constant', constant_values=0)
+
+    hop = int(crepe.core.model_srate * step_size / 1000)
+    n_frames = 1 + int((len(audio) - 1024) / hop)
+    frames = np.lib.stride_tricks.as_strided(
+        audio, shape=(n_frames, 1024), strides=(hop * audio.itemsize, audio.itemsize)
+    ).copy()
+    frames -= np.mean(frames, axis=1)[:, np.newaxis]
+    frames /= np.clip(np.std(frames, axis=1)[:, np.newaxis], 1e-8, None)
+    return frames
+
+def run_crepe_batch(signals, sr, step_size, model_capacity="medium", batch_size=512):
+    """Run CREPE over several signals with a single batched model call.
+
+    Returns one (times, f0, confidence) tuple per signal, matching what
+    crepe.predict(viterbi=True, center=True) gives for each on its own.
+    """
+    model = load_crepe_model(model_capacity)
+    frames = [_crepe_frames(y, sr, step_size) for y in signals]
+    logger.info(f"Batched CREPE: {len(signals)} clips, {sum(len(f) for f in frames)} frames")
+    activation = model.predict(np.concatenate(frames), batch_size=batch_size, verbose=0)
+
+    results = []
+    offset = 0
+    for clip_frames in frames:
+        clip_activation = activation[offset:offset + len(clip_frames)]
+        offset += len(clip_frames)
+
+        confidence = clip_activation.max(axis=1)
+        cents = crepe.core.to_viterbi_cents(clip_activation)
+        f0 = 10 * 2 ** (cents / 1200)
+        f0[np.isnan(f0)] = 0
+        times = np.arange(len(confidence)) * step_size / 1000.0
+        results.append((times, f0, confidence))
+    return results
+
+def fuse_weighted(f0_pyin, conf_pyin, f0_crepe, conf_crepe):
+    """Confidence-weighted average of both trackers, gated on combined confidence"""
+    total_conf = conf_pyin + conf_crepe
+    keep = total_conf > 0.6
+    safe_total = np.where(keep, total_conf, 1.0)
+    f0 = np.where(keep, (f0_pyin * conf_pyin + f0_crepe * conf_crepe) / safe_total, 0.0)
+    confidences = np.where(keep, np.maximum(conf_pyin, conf_crepe), 0.0)
+    return f0, confidences
+
+def fuse_max_confidence(f0_pyin, conf_pyin, f0_crepe, conf_crepe):
+    """Per frame, take whichever tracker is more confident"""
+    use_crepe = conf_crepe > conf_pyin
+    f0 = np.where(use_crepe, f0_crepe, f0_pyin)
+    confidences = np.where(use_crepe, conf_crepe, conf_pyin)
+    return f0, confidences
+
+def fuse_pyin_only(f0_pyin, conf_pyin, f0_crepe, conf_crepe):
+    return f0_pyin, conf_pyin
+
+def fuse_crepe_only(f0_pyin, conf_pyin, f0_crepe, conf_crepe):
+    return f0_crepe, conf_crepe
+
+# name -> (fusion function, needs PYIN, needs CREPE)
+FUSION_STRATEGIES = {
+    "weighted": (fuse_weighted, True, True),
+    "max_confidence": (fuse_max_confidence, True, True),
+    "pyin": (fuse_pyin_only, True, False),
+    "crepe": (fuse_crepe_only, False, True),
+}
+
+def run_pyin(y, sr, frame_length=1024, hop_length=256):
+    """PYIN pitch track with NaNs replaced by zeros"""
     f0_pyin, voiced_flag, voiced_probs = librosa.pyin(
         y, fmin=75, fmax=1000, sr=sr,
         frame_length=frame_length, hop_length=hop_length,
         fill_na=0, resolution=0.1,
         boltzmann_parameter=2.0
     )
-    n_frames = len(f0_pyin)
-    frame_times = librosa.frames_to_time(np.arange(n_frames), sr=sr, hop_length=hop_length)
+    return np.nan_to_num(f0_pyin, nan=0), np.nan_to_num(voiced_probs, nan=0)
 
-    crepe_step_size = int(round(1000 * hop_length / sr))
-    times_crepe, f0_crepe, confidence_crepe, _ = run_crepe(y, sr, crepe_step_size)
+def run_yin(y, sr, frame_length=1024, hop_length=256, fmin=75, fmax=1000, threshold=0.1, decimate=2):
+    """Vectorized YIN with parabolic refinement; same (f0, voiced_probs) contract as run_pyin.
 
-    f0 = np.zeros(n_frames)
-    confidences = np.zeros(n_frames)
+    Since fmax is far below Nyquist the signal is first decimated by
+    `decimate` (with an anti-aliasing FIR), which shrinks the frames, the
+    lag range and the FFTs by the same factor. All frames are then handled
+    at once: the difference function comes from one batched FFT
+    cross-correlation plus cumulative energies, the first normalized trough
+    below `threshold` gives the period, and a parabola through its
+    neighbours refines it below one sample. voiced_probs is 1 minus the
+    normalized difference at that trough; unvoiced frames get f0 = 0.
+    """
+    n_frames = 1 + len(y) // hop_length
+    if decimate > 1:
+        y = resample_poly(y, 1, decimate)
+        sr, frame_length, hop_length = sr / decimate, frame_length // decimate, hop_length // decimate
 
-    if times_crepe is not None:
-        f0_crepe_aligned = np.interp(frame_times, times_crepe, f0_crepe, left=0, right=0)
-        conf_crepe_aligned = np.interp(frame_times, times_crepe, confidence_crepe, left=0, right=0)
+    min_lag = max(1, int(np.floor(sr / fmax)))
+    max_lag = min(frame_length - 2, int(np.ceil(sr / fmin)))
+    window = frame_length - max_lag - 1
 
-        for i in range(n_frames):
-            pyin_val = f0_pyin[i] if not np.isnan(f0_pyin[i]) else 0
-            pyin_conf = voiced_probs[i] if not np.isnan(voiced_probs[i]) else 0
-            crepe_val = f0_crepe_aligned[i]
-            crepe_conf = conf_crepe_aligned[i]
-            total_conf = pyin_conf + crepe_conf
+    padded = np.pad(np.asarray(y, dtype=np.float64), (frame_length // 2, frame_length))
+    frames = librosa.util.frame(padded, frame_length=frame_length, hop_length=hop_length, axis=0)[:n_frames]
 
-            if total_conf > 0.6:
-                f0[i] = (pyin_val * pyin_conf + crepe_val * crepe_conf) / total_conf
-                confidences[i] = max(pyin_conf, crepe_conf)
-            else:
-                f0[i] = 0
-                confidences[i] = 0
+    # d(lag) = sum_j (x[j] - x[j + lag])^2 over the first `window` samples
+    n_fft = 1 << int(np.ceil(np.log2(frame_length + window)))
+    cross = np.fft.irfft(
+        np.conj(np.fft.rfft(frames[:, :window], n_fft)) * np.fft.rfft(frames, n_fft), n_fft
+    )[:, :max_lag + 2]
+    energy = np.concatenate([np.zeros((len(frames), 1)), np.cumsum(frames ** 2, axis=1)], axis=1)
+    lags = np.arange(max_lag + 2)
+    shifted_energy = energy[:, lags + window] - energy[:, lags]
+    diff = np.maximum(energy[:, [window]] + shifted_energy - 2 * cross, 0)
+
+    # Cumulative mean normalized difference
+    cmnd = np.ones_like(diff)
+    running = np.cumsum(diff[:, 1:], axis=1)
+    cmnd[:, 1:] = diff[:, 1:] * lags[1:] / np.maximum(running, 1e-12)
+
+    search = cmnd[:, min_lag:max_lag + 1]
+    trough = (search < cmnd[:, min_lag - 1:max_lag]) & (search <= cmnd[:, min_lag + 1:max_lag + 2])
+    candidates = trough & (search < threshold)
+    voiced = candidates.any(axis=1) & (energy[:, window] > 1e-8)
+    best = np.where(voiced, np.argmax(candidates, axis=1), np.argmin(search, axis=1)) + min_lag
+
+    rows = np.arange(len(frames))
+    before, at, after = cmnd[rows, best - 1], cmnd[rows, best], cmnd[rows, best + 1]
+    curvature = before - 2 * at + after
+    shift = np.where(np.abs(curvature) > 1e-12, (before - after) / (2 * np.where(curvature == 0, 1, curvature)), 0)
+    period = best + np.clip(shift, -1, 1)
+
+    f0 = np.where(voiced, sr / period, 0.0)
+    voiced_probs = np.where(energy[:, window] > 1e-8, np.clip(1 - at, 0, 1), 0.0)
+    if len(f0) < n_frames:
+        f0 = np.pad(f0, (0, n_frames - len(f0)))
+        voiced_probs = np.pad(voiced_probs, (0, n_frames - len(voiced_probs)))
+    return f0, voiced_probs
+
+# name -> function(y, sr, frame_length, hop_length) returning (f0, voiced_probs)
+PITCH_TRACKERS = {
+    "pyin": run_pyin,
+    "yin": run_yin,
+}
+
+def _align_crepe(frame_times, times_crepe, f0_crepe, confidence_crepe, offset=0.0):
+    """Interpolate a CREPE track (times relative to offset) onto analysis frames"""
+    times = times_crepe + offset
+    return (
+        np.interp(frame_times, times, f0_crepe, left=0, right=0),
+        np.interp(frame_times, times, confidence_crepe, left=0, right=0),
+    )
+
+def _runs(mask):
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], mask.astype(np.int8), [0]])))
+    return edges[::2], edges[1::2]
+
+def uncertain_regions(y, sr, conf_pyin, hop_length=256, frame_length=1024, min_confidence=0.6,
+                      min_rms=0.01, min_run_seconds=0.06, pad_seconds=0.03):
+    """Frame ranges [(start, end), ...] where the signal is audible but PYIN is unsure.
+
+    Runs shorter than min_run_seconds (the few frames around every note
+    transition) are ignored; the rest are padded by pad_seconds and merged.
+    """
+    rms = librosa.feature.rms(y=y, frame_length=frame_length, hop_length=hop_length)[0][:len(conf_pyin)]
+    uncertain = (conf_pyin[:len(rms)] < min_confidence) & (rms >= min_rms)
+    starts, ends = _runs(uncertain)
+    long_runs = ends - starts >= int(round(min_run_seconds * sr / hop_length))
+    if not long_runs.any():
+        return []
+
+    pad = int(round(pad_seconds * sr / hop_length))
+    regions = np.zeros(len(uncertain) + 1, dtype=np.int32)
+    np.add.at(regions, np.maximum(starts[long_runs] - pad, 0), 1)
+    np.add.at(regions, np.minimum(ends[long_runs] + pad, len(uncertain)), -1)
+    starts, ends = _runs(np.cumsum(regions[:-1]) > 0)
+    return list(zip(starts.tolist(), ends.tolist()))
+
+def adaptive_crepe_regions(y, sr, conf_pyin, n_frames, hop_length=256, frame_length=1024):
+    """Frame ranges adaptive quality sends to CREPE: the uncertain regions, or
+    the whole clip once they cover more than max_fraction of it"""
+    params = ADAPTIVE_CREPE_PARAMS
+    regions = uncertain_regions(
+        y, sr, conf_pyin, hop_length, frame_length, params["min_confidence"],
+        params["min_rms"], params["min_run_seconds"], params["pad_seconds"]
+    )
+    covered = sum(end - start for start, end in regions)
+    if covered > params["max_fraction"] * n_frames:
+        logger.info(f"PYIN unsure on {covered}/{n_frames} frames, running CREPE on the whole clip")
+        return [(0, n_frames)]
+    logger.info(f"PYIN unsure on {covered}/{n_frames} frames in {len(regions)} regions, running CREPE there")
+    return regions
+
+def _region_signal(y, region, hop_length):
+    start, end = region
+    return y[start * hop_length:min(len(y), end * hop_length)]
+
+def _assemble_regions(frame_times, regions, crepe_tracks, sr, hop_length):
+    """Lay per-region CREPE (times, f0, confidence) tracks onto the analysis frames, zero elsewhere"""
+    f0 = np.zeros(len(frame_times))
+    confidence = np.zeros(len(frame_times))
+    for (start, end), (times_crepe, f0_crepe, confidence_crepe) in zip(regions, crepe_tracks):
+        f0[start:end], confidence[start:end] = _align_crepe(
+            frame_times[start:end], times_crepe, f0_crepe, confidence_crepe, start * hop_length / sr
+        )
+    return f0, confidence
+
+def run_crepe_adaptive(y, sr, frame_times, conf_pyin, hop_length=256, frame_length=1024,
+                       model_capacity="medium", backend="inprocess", timeout=45):
+    """CREPE only where PYIN is unsure; returns a (f0, confidence) track on the
+    analysis frames, zero elsewhere, or None if CREPE failed"""
+    regions = adaptive_crepe_regions(y, sr, conf_pyin, len(frame_times), hop_length, frame_length)
+    step_size = crepe_step_size_ms(sr, hop_length)
+    tracks = []
+    for region in regions:
+        times_crepe, f0_crepe, confidence_crepe, _ = run_crepe(
+            _region_signal(y, region, hop_length), sr, step_size, model_capacity, backend, timeout
+        )
+        if times_crepe is None:
+            return None
+        tracks.append((times_crepe, f0_crepe, confidence_crepe))
+    return _assemble_regions(frame_times, regions, tracks, sr, hop_length)
+
+def run_crepe_adaptive_batch(signals, sr, pitch_tracks, model_capacity="medium",
+                             hop_length=256, frame_length=1024):
+    """Adaptive CREPE for several clips with a single batched model call.
+
+    pitch_tracks holds each clip's (f0, confidence) from the pitch tracker.
+    The uncertain regions of every clip go through one run_crepe_batch call;
+    returns one (frame_times, f0, confidence) tuple per clip, usable as
+    get_vocal_pitch's crepe_result.
+    """
+    plans = []
+    for y, (_, conf_pyin) in zip(signals, pitch_tracks):
+        n_frames = 1 + len(y) // hop_length
+        frame_times = librosa.frames_to_time(np.arange(n_frames), sr=sr, hop_length=hop_length)
+        plans.append((frame_times, adaptive_crepe_regions(y, sr, conf_pyin, n_frames, hop_length, frame_length)))
+
+    regions = [_region_signal(y, region, hop_length)
+               for y, (_, clip_regions) in zip(signals, plans) for region in clip_regions]
+    tracks = iter(run_crepe_batch(regions, sr, crepe_step_size_ms(sr, hop_length), model_capacity)
+                  if regions else [])
+
+    results = []
+    for frame_times, clip_regions in plans:
+        clip_tracks = [next(tracks) for _ in clip_regions]
+        results.append((frame_times, *_assemble_regions(frame_times, clip_regions, clip_tracks, sr, hop_length)))
+    return results
+
+def get_vocal_pitch(y, sr, frame_length=1024, hop_length=256,
+                    model_capacity=DEFAULT_OPTIONS["model_capacity"],
+                    crepe_backend=DEFAULT_OPTIONS["crepe_backend"],
+                    crepe_timeout=DEFAULT_OPTIONS["crepe_timeout"],
+                    fusion=DEFAULT_OPTIONS["fusion"], report=None, crepe_result=None,
+                    quality=DEFAULT_OPTIONS["quality"], pitch_tracker=DEFAULT_OPTIONS["pitch_tracker"],
+                    pitch_result=None):
+    """Hybrid PYIN/CREPE pitch detection merged with a selectable fusion strategy
+
+    crepe_result, if given, is a precomputed (times, f0, confidence) tuple
+    from run_crepe_batch or run_crepe_adaptive_batch and replaces the
+    per-clip CREPE call; pitch_result, likewise, is the pitch tracker's
+    (f0, confidence) when the batch already computed it. quality
+    trades accuracy for latency: "full" runs CREPE over the whole clip,
+    "adaptive" only where PYIN is unsure (see run_crepe_adaptive) and
+    "fast" never. pitch_tracker picks the PITCH_TRACKERS entry that fills
+    the PYIN role.
+    """
+    fuse, needs_pyin, needs_crepe = FUSION_STRATEGIES[fusion]
+    track_pitch = PITCH_TRACKERS[pitch_tracker]
+    if quality == "fast":
+        fuse, needs_pyin, needs_crepe = FUSION_STRATEGIES["pyin"]
+
+    # Same frame count librosa produces for centered frames
+    n_frames = 1 + len(y) // hop_length
+    frame_times = librosa.frames_to_time(np.arange(n_frames), sr=sr, hop_length=hop_length)
+
+    f0_pyin = conf_pyin = None
+    if pitch_result is not None:
+        f0_pyin, conf_pyin = pitch_result
+    elif needs_pyin:
+        with timed(pitch_tracker):
+            f0_pyin, conf_pyin = track_pitch(y, sr, frame_length, hop_length)
+
+    crepe_track = None
+    if needs_crepe and crepe_result is not None:
+        crepe_track = _align_crepe(frame_times, *crepe_result)
+    elif needs_crepe and needs_pyin and quality == "adaptive":
+        with timed("crepe"):
+            crepe_track = run_crepe_adaptive(
+                y, sr, frame_times, conf_pyin, hop_length, frame_length,
+                model_capacity, crepe_backend, crepe_timeout
+            )
+    elif needs_crepe:
+        crepe_step_size = crepe_step_size_ms(sr, hop_length)
+        with timed("crepe"):
+            times_crepe, f0_crepe, confidence_crepe, _ = run_crepe(
+                y, sr, crepe_step_size, model_capacity, crepe_backend, crepe_timeout
+            )
+        if times_crepe is not None:
+            crepe_track = _align_crepe(frame_times, times_crepe, f0_crepe, confidence_crepe)
+
+    if crepe_track is not None:
+        f0, confidences = fuse(f0_pyin, conf_pyin, *crepe_track)
     else:
-        logger.warning("Using PYIN only due to CREPE failure")
-        f0 = np.nan_to_num(f0_pyin, nan=0)
-        confidences = np.nan_to_num(voiced_probs, nan=0)
+        if needs_crepe:
+            logger.warning("Using PYIN only due to CREPE failure")
+            if report is not None:
+                report["crepe_failed"] = True
+        if f0_pyin is None:
+            with timed(pitch_tracker):
+                f0_pyin, conf_pyin = track_pitch(y, sr, frame_length, hop_length)
+        f0, confidences = f0_pyin, conf_pyin
 
     f0 = medfilt(f0, kernel_size=5)
     return f0, confidences, frame_times
 
-def detect_note_boundaries(y, sr, hop_length=256, frame_length=1024):
-    """Optimized note boundary detection with higher thresholds"""
+def extract_features(y, sr, hop_length=256, frame_length=1024, n_fft=2048, S=None):
+    """Compute the shared spectral features used by the downstream stages.
+
+    One magnitude STFT (at the resolution onset_strength always used) feeds
+    the mel spectrogram and onset envelope. Spectral flux keeps its own
+    frame_length STFT so the boundary thresholds stay tuned to it, and RMS
+    stays in the time domain (no FFT needed) so volume thresholds keep their
+    calibration. A magnitude STFT already computed for y with the same n_fft
+    and hop (e.g. by spectral_gate) can be passed in as S.
+    """
+    if S is None:
+        S = np.abs(librosa.stft(y, n_fft=n_fft, hop_length=hop_length))
+
+    mel = librosa.feature.melspectrogram(S=S**2, sr=sr, n_mels=32, fmax=800)
     onset_env = librosa.onset.onset_strength(
-        y=y, sr=sr, hop_length=hop_length, aggregate=np.median,
-        fmax=800, n_mels=32
+        S=librosa.power_to_db(mel), sr=sr, n_fft=n_fft,
+        hop_length=hop_length, aggregate=np.median
     )
 
-    S = np.abs(librosa.stft(y, n_fft=frame_length, hop_length=hop_length))
-    spectral_flux = np.sum(np.maximum(0, S[1:] - S[:-1]), axis=0)
+    S_flux = S if n_fft == frame_length else np.abs(
+        librosa.stft(y, n_fft=frame_length, hop_length=hop_length)
+    )
+    spectral_flux = np.sum(np.maximum(0, S_flux[1:] - S_flux[:-1]), axis=0)
 
     rms = librosa.feature.rms(y=y, frame_length=frame_length, hop_length=hop_length)[0]
+
+    return {
+        "S": S,
+        "mel": mel,
+        "onset_env": onset_env,
+        "spectral_flux": spectral_flux,
+        "rms": rms,
+    }
+
+def detect_note_boundaries(y, sr, hop_length=256, frame_length=1024, features=None):
+    """Optimized note boundary detection with higher thresholds"""
+    if features is None:
+        features = extract_features(y, sr, hop_length, frame_length)
+
+    onset_env = features["onset_env"]
+    spectral_flux = features["spectral_flux"]
+    rms = features["rms"]
     rms_diff = np.diff(rms, prepend=[0])
 
     onset_env = librosa.util.normalize(onset_env)
@@ -199,234 +860,815 @@ def detect_note_boundaries(y, sr, hop_length=256, frame_length=1024):
     logger.info(f"Detected {len(pruned)} pruned boundaries")
     return np.array(pruned)
 
-def get_dominant_pitch(f0, confidences, start_frame, end_frame):
-    """Simplified pitch detection using weighted median"""
-    segment_f0 = f0[start_frame:end_frame]
-    segment_conf = confidences[start_frame:end_frame]
-    
-    valid_mask = (segment_f0 > 75) & (segment_f0 < 1000) & (segment_conf > 0.4)
-    valid_f0 = segment_f0[valid_mask]
-    valid_conf = segment_conf[valid_mask]
+def _segment_frames(frame_starts, frame_ends):
+    """Flatten [start, end) frame ranges into (segment ids, frame indices, offsets)"""
+    lengths = frame_ends - frame_starts
+    offsets = np.cumsum(lengths) - lengths
+    seg_ids = np.repeat(np.arange(len(lengths)), lengths)
+    frame_idx = np.arange(lengths.sum()) - np.repeat(offsets - frame_starts, lengths)
+    return seg_ids, frame_idx, offsets
 
-    if len(valid_f0) < 3:
-        return None, 0.0
+def _lerp(a, b, t):
+    # Same two-sided formula np.percentile uses, so results match bit for bit
+    diff = b - a
+    return np.where(t >= 0.5, b - diff * (1 - t), a + diff * t)
 
-    sorted_idx = np.argsort(valid_f0)
-    sorted_f0 = valid_f0[sorted_idx]
-    sorted_conf = valid_conf[sorted_idx]
-    
-    cum_weights = np.cumsum(sorted_conf)
-    total_weight = cum_weights[-1]
-    median_idx = np.searchsorted(cum_weights, total_weight * 0.5)
-    
-    return sorted_f0[median_idx], sorted_conf[median_idx]
+def _segmented_cumsum(values, counts, offsets):
+    """Running sum restarting at each segment, bit-identical to np.cumsum per segment.
+
+    Segments are bucketed by length rounded up to a power of two and each
+    bucket is cumsum'd as a zero-padded 2D block, so padding stays under 2x.
+    """
+    out = np.empty_like(values)
+    nonempty = counts > 0
+    buckets = np.ceil(np.log2(np.maximum(counts, 1))).astype(int)
+    for bucket in np.unique(buckets[nonempty]):
+        segs = np.nonzero(nonempty & (buckets == bucket))[0]
+        columns = np.arange(1 << bucket)
+        mask = columns[np.newaxis, :] < counts[segs][:, np.newaxis]
+        index = (offsets[segs][:, np.newaxis] + columns[np.newaxis, :])[mask]
+        block = np.zeros(mask.shape)
+        block[mask] = values[index]
+        out[index] = np.cumsum(block, axis=1)[mask]
+    return out
+
+def segment_percentiles(values, seg_ids, n_segments, q):
+    """Linear-interpolated q-th percentile of values within each segment"""
+    order = np.lexsort((values, seg_ids))
+    sorted_values = values[order]
+    counts = np.bincount(seg_ids, minlength=n_segments)
+    offsets = np.cumsum(counts) - counts
+
+    position = (counts - 1) * (q / 100.0)
+    lower = np.floor(position).astype(int)
+    upper = np.minimum(lower + 1, counts - 1)
+    return _lerp(sorted_values[offsets + lower], sorted_values[offsets + upper], position - lower)
+
+def segment_dominant_pitch(f0, confidences, seg_ids, frame_idx, n_segments):
+    """Confidence-weighted median f0 per segment.
+
+    Returns (pitch_hz, confidence, has_pitch); segments with fewer than 3
+    confident in-range frames have has_pitch False.
+    """
+    seg_f0 = f0[frame_idx]
+    seg_conf = confidences[frame_idx]
+    valid = (seg_f0 > 75) & (seg_f0 < 1000) & (seg_conf > 0.4)
+    valid_ids = seg_ids[valid]
+    valid_f0 = seg_f0[valid]
+    valid_conf = seg_conf[valid]
+
+    counts = np.bincount(valid_ids, minlength=n_segments)
+    has_pitch = counts >= 3
+    pitch_hz = np.zeros(n_segments)
+    pitch_conf = np.zeros(n_segments)
+    if not valid_ids.size:
+        return pitch_hz, pitch_conf, has_pitch
+
+    order = np.lexsort((valid_f0, valid_ids))
+    sorted_ids = valid_ids[order]
+    sorted_f0 = valid_f0[order]
+    sorted_conf = valid_conf[order]
+
+    offsets = np.cumsum(counts) - counts
+    cum_weights = _segmented_cumsum(sorted_conf, counts, offsets)
+    totals = np.zeros(n_segments)
+    totals[has_pitch] = cum_weights[offsets[has_pitch] + counts[has_pitch] - 1]
+
+    # First index whose running weight reaches half the segment total
+    below = cum_weights < np.repeat(totals * 0.5, counts)
+    median_pos = offsets + np.bincount(sorted_ids, weights=below, minlength=n_segments).astype(int)
+
+    pitch_hz[has_pitch] = sorted_f0[median_pos[has_pitch]]
+    pitch_conf[has_pitch] = sorted_conf[median_pos[has_pitch]]
+    return pitch_hz, pitch_conf, has_pitch
 
-def apply_musical_corrections(notes, min_gap=0.05, min_duration=0.05, max_pitch_diff=0.5, min_volume_diff=10):
-    """Enhanced musical corrections with parameters matching the pipeline's characteristics
+def resolve_corrections(overrides=None):
+    """Merge per-request correction rules over CORRECTION_PARAMS and validate them"""
+    params = dict(CORRECTION_PARAMS)
+    for name, value in (overrides or {}).items():
+        if name not in CORRECTION_PARAMS:
+            raise ValueError(f"Unknown correction rule: {name}")
+        params[name] = value
+
+    for name in ("min_gap", "min_duration", "max_pitch_diff", "min_volume_diff", "fill_gap"):
+        params[name] = float(params[name])
+    if params["key"] is not None:
+        scale_pitches(params["key"])
+    return params
+
+def apply_musical_corrections(notes, min_gap=0.05, min_duration=0.05, max_pitch_diff=0.5,
+                              min_volume_diff=10, fill_gap=0.0, key=None):
+    """Scale snapping, merging, min-duration filtering and gap filling in one pass
     
     Args:
-        notes: List of note dictionaries
+        notes: NOTE_DTYPE array sorted by start
         min_gap: Maximum gap between notes to consider merging (seconds)
         min_duration: Minimum duration for a note to be kept (seconds)
         max_pitch_diff: Maximum pitch difference for merging (semitones)
         min_volume_diff: Minimum volume difference to prevent merging
+        fill_gap: Silences up to this long are closed by extending the earlier note (seconds)
+        key: Snap pitches to this key's scale first, e.g. "C major" or "F# minor"
         
     Returns:
-        List of consolidated note dictionaries
+        NOTE_DTYPE array of consolidated notes
     """
-    if not notes:
+    if not len(notes):
         return notes
     
-    consolidated = []
-    current_note = notes[0]
+    pitches = notes["pitch"] + notes["cents"] / 100
+    midis, cents = notes["pitch"], notes["cents"]
+    if key is not None:
+        pitches = snap_to_scale(pitches, key)
+        midis, cents = pitches, np.zeros(len(notes), dtype=int)
     
-    for next_note in notes[1:]:
-        gap = next_note['start'] - current_note['end']
-        
-        try:
-            current_pitch = librosa.note_to_midi(current_note['note'])
-            next_pitch = librosa.note_to_midi(next_note['note'])
-            pitch_diff = abs(current_pitch - next_pitch)
-            volume_diff = abs(current_note['volume'] - next_note['volume'])
-        except Exception as e:
-            logger.debug(f"Note conversion error: {e}")
-            consolidated.append(current_note)
-            current_note = next_note
-            continue
-        
-        if (gap < min_gap and 
-            pitch_diff < max_pitch_diff and
-            volume_diff < min_volume_diff):
+    debug = logger.isEnabledFor(logging.DEBUG)
+    out = []
+    
+    def emit(midi, note_cents, start, end, volume):
+        if round(end - start, 3) < min_duration:
+            return
+        if out and 0 < start - out[-1][3] <= fill_gap:
+            out[-1][3] = start
+        out.append([midi, note_cents, start, end, volume])
+    
+    cur_pitch, cur_midi, cur_cents, cur_start, cur_end, cur_volume = None, 0, 0, 0.0, 0.0, 0
+    for pitch, midi, note_cents, start, end, volume in zip(
+        pitches.tolist(), midis.tolist(), cents.tolist(),
+        notes["start"].tolist(), notes["end"].tolist(), notes["volume"].tolist()
+    ):
+        if cur_pitch is not None:
+            gap = start - cur_end
+            pitch_diff = abs(cur_pitch - pitch)
+            volume_diff = abs(cur_volume - volume)
             
-            current_note['end'] = next_note['end']
-            current_note['duration'] = round(current_note['end'] - current_note['start'], 3)
+            if gap < min_gap and pitch_diff < max_pitch_diff and volume_diff < min_volume_diff:
+                duration = round(round(end, 3) - round(cur_start, 3), 3)
+                next_duration = round(end - start, 3)
+                cur_end = end
+                cur_volume = int((cur_volume * duration + volume * next_duration) / (duration + next_duration))
+                if debug:
+                    logger.debug(
+                        f"Merged: {note_name(cur_midi, cur_cents)} + {note_name(midi, note_cents)} | "
+                        f"Gap: {gap:.3f}s, Pitch Δ: {pitch_diff:.1f}, Vol Δ: {volume_diff}"
+                    )
+                continue
             
-            total_dur = current_note['duration'] + next_note['duration']
-            current_note['volume'] = int(
-                (current_note['volume'] * current_note['duration'] + 
-                 next_note['volume'] * next_note['duration']) / total_dur
-            )
-            
-            logger.debug(
-                f"Merged: {current_note['note']} + {next_note['note']} | "
-                f"Gap: {gap:.3f}s, Pitch Δ: {pitch_diff:.1f}, Vol Δ: {volume_diff}"
-            )
-        else:
-            consolidated.append(current_note)
-            current_note = next_note
+            emit(cur_midi, cur_cents, cur_start, cur_end, cur_volume)
+        
+        cur_pitch, cur_midi, cur_cents, cur_start, cur_end, cur_volume = pitch, midi, note_cents, start, end, volume
     
-    consolidated.append(current_note)
+    emit(cur_midi, cur_cents, cur_start, cur_end, cur_volume)
     
-    consolidated = [n for n in consolidated if n['duration'] >= min_duration]
+    consolidated = np.array([tuple(row) for row in out], dtype=NOTE_DTYPE)
     
     logger.info(
         f"Musical corrections applied. Notes: {len(notes)} → {len(consolidated)} | "
         f"Params: gap={min_gap}s, dur={min_duration}s, "
-        f"pitchΔ={max_pitch_diff}semitones, volΔ={min_volume_diff}"
+        f"pitchΔ={max_pitch_diff}semitones, volΔ={min_volume_diff}, "
+        f"fill={fill_gap}s, key={key}"
     )
     
     return consolidated
 
+def load_audio_url(audio_url, ingest="stream"):
+    """Fetch and decode one URL, either streamed or via a downloaded file"""
+    if os.path.isfile(audio_url):
+        with timed("decode"):
+            return decode_audio(audio_url)
+    if ingest == "stream":
+        with timed("download_decode"):
+            return stream_decode_url(audio_url)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        logger.info(f"Created temporary directory: {tmpdir}")
+        
+        ext = os.path.splitext(audio_url)[1] or ".webm"
+        input_path = os.path.join(tmpdir, f"input{ext}")
+        
+        with timed("download"):
+            if not download_audio(audio_url, input_path):
+                raise Exception("Audio download failed")
+        
+        logger.info("Decoding and processing audio")
+        with timed("decode"):
+            return decode_audio(input_path)
+
+def _load_or_cached(audio_url, options, cache):
+    """Return (cached_result, None) on a cache hit, else (None, (y, sr, audio_digest))"""
+    # Cloudinary URLs are immutable, so a URL we have already decoded maps
+    # straight to its audio digest and the download can be skipped.
+    is_remote = not os.path.isfile(audio_url)
+    if cache is not None and is_remote:
+        with timed("cache_lookup"):
+            audio_digest = cache.get(hash_key("url", audio_url))
+            cached = None
+            if audio_digest is not None:
+                cached = _get_cached_result(cache, audio_digest.decode(), options)
+        if cached is not None:
+            return cached, None
+
+    y, sr = load_audio_url(audio_url, options["ingest"])
+    duration = len(y)/sr
+    logger.info(f"Audio loaded: {len(y)} samples, {duration:.2f} seconds, SR: {sr}Hz")
+
+    audio_digest = None
+    if cache is not None:
+        with timed("cache_lookup"):
+            audio_digest = hash_key(memoryview(np.ascontiguousarray(y)), sr)
+            if is_remote:
+                cache.put(hash_key("url", audio_url), audio_digest.encode())
+            cached = _get_cached_result(cache, audio_digest, options)
+        if cached is not None:
+            return cached, None
+
+    return None, (y, sr, audio_digest)
+
+def _store_result(cache, audio_digest, options, result, report):
+    if cache is None:
+        return
+    if report.get("crepe_failed"):
+        logger.info("Not caching result: CREPE failed and PYIN was used alone")
+    else:
+        with timed("cache_store"):
+            cache.put(_result_key(audio_digest, options), json.dumps(result).encode())
+    result["cache"] = dict(cache.stats(), hit=False)
+
+def analyze_audio(audio_url, options=None):
+    """Run the full transcription pipeline on one audio URL.
+
+    The result carries per-stage wall-clock seconds under "timings" and,
+    with options["profile"], the path of a cProfile dump under "profile_file".
+    """
+    options = resolve_options(options)
+    timer = StageTimer()
+    with timer.activate(), maybe_profile(options["profile"], PROFILE_DIR, "analyze") as profile:
+        result = _analyze_audio(audio_url, options)
+    result.update(profile)
+    _finish_timings(result, timer, audio_url)
+    return result
+
+def _finish_timings(result, timer, audio_url):
+    result["timings"] = timer.as_dict()
+    append_metrics(METRICS_FILE, {
+        "audio_url": audio_url,
+        "success": result.get("success", False),
+        "notes": len(result.get("notes", [])),
+        "cache_hit": result.get("cache", {}).get("hit", False),
+        "timings": result["timings"],
+    })
+    logger.info(f"Stage timings: {result['timings']}")
+
+def _analyze_audio(audio_url, options):
+    cache = get_result_cache() if options["cache"] else None
+
+    cached, audio = _load_or_cached(audio_url, options, cache)
+    if cached is not None:
+        return cached
+    y, sr, audio_digest = audio
+
+    result, report = transcribe(y, sr, options)
+    _store_result(cache, audio_digest, options, result, report)
+    return result
+
+def analyze_batch(audio_urls, options=None, on_result=None, group_size=8, decode_workers=4):
+    """Analyze many recordings in one pass with batched CREPE inference.
+
+    Downloads and decodes run concurrently. Decoded clips are collected into
+    groups of group_size whose CREPE frames go through the model in a single
+    predict call. on_result(index, result) fires as each item finishes, in
+    completion order; the full list is also returned in input order.
+    """
+    options = resolve_options(options)
+    cache = get_result_cache() if options["cache"] else None
+    results = [None] * len(audio_urls)
+    timers = [StageTimer() for _ in audio_urls]
+
+    def finish(index, result):
+        _finish_timings(result, timers[index], audio_urls[index])
+        results[index] = result
+        if on_result is not None:
+            on_result(index, result)
+
+    def load(index, url):
+        with timers[index].activate():
+            return _load_or_cached(url, options, cache)
+
+    group = []
+    with ThreadPoolExecutor(max_workers=decode_workers) as pool:
+        futures = {
+            pool.submit(load, index, url): index
+            for index, url in enumerate(audio_urls)
+        }
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                cached, audio = future.result()
+            except Exception as e:
+                logger.error(f"Batch item {index} failed to load: {str(e)}")
+                finish(index, _error_payload(e))
+                continue
+
+            if cached is not None:
+                finish(index, cached)
+                continue
+
+            group.append((index, audio))
+            if len(group) >= group_size:
+                _run_batch_group(group, options, cache, timers, finish)
+                group = []
+
+    if group:
+        _run_batch_group(group, options, cache, timers, finish)
+    return results
+
+def _run_batch_group(group, options, cache, timers, finish):
+    sr = group[0][1][1]
+    # Long recordings skip batched CREPE and go through chunked analysis alone
+    for index, (y, _, audio_digest) in [item for item in group if _should_chunk(item[1][0], sr, options)]:
+        try:
+            with timers[index].activate():
+                result, report = transcribe_chunked(y, sr, options)
+                _store_result(cache, audio_digest, options, result, report)
+        except Exception as e:
+            logger.error(f"Batch item {index} failed: {str(e)}")
+            result = _error_payload(e)
+        finish(index, result)
+    group = [item for item in group if not _should_chunk(item[1][0], sr, options)]
+    if not group:
+        return
+
+    prepared = []
+    spectrograms = []
+    ready = []
+    for item in group:
+        index, (y, _, _) = item
+        try:
+            with timers[index].activate():
+                y, S = prepare_signal(y, sr, options["denoise"])
+        except Exception as e:
+            logger.error(f"Batch item {index} failed: {str(e)}")
+            finish(index, _error_payload(e))
+            continue
+        ready.append(item)
+        prepared.append(y)
+        spectrograms.append(S)
+    group = ready
+    if not group:
+        return
+
+    crepe_results = [None] * len(group)
+    pitch_results = [None] * len(group)
+    _, needs_pyin, needs_crepe = FUSION_STRATEGIES[options["fusion"]]
+    # As in get_vocal_pitch, adaptive quality without a pitch tracker to
+    # consult runs CREPE over the whole clip
+    adaptive = options["quality"] == "adaptive" and needs_pyin
+    if needs_crepe and options["quality"] != "fast":
+        tracked = []
+        if adaptive:
+            # The pitch tracker picks each clip's uncertain regions up front so
+            # the regions of every clip can share one batched CREPE call
+            for position, ((index, _), y) in enumerate(zip(group, prepared)):
+                try:
+                    with timers[index].activate(), timed(options["pitch_tracker"]):
+                        pitch_results[position] = PITCH_TRACKERS[options["pitch_tracker"]](
+                            y, sr, FRAME_LENGTH, HOP_LENGTH
+                        )
+                    tracked.append(position)
+                except Exception as e:
+                    # transcribe_prepared reruns the tracker and reports the error
+                    logger.error(f"Batch item {index} pitch tracking failed: {str(e)}")
+
+        batch_timer = StageTimer()
+        try:
+            with batch_timer.activate(), timed("crepe_batch"):
+                if adaptive:
+                    adaptive_results = run_crepe_adaptive_batch(
+                        [prepared[position] for position in tracked], sr,
+                        [pitch_results[position] for position in tracked],
+                        options["model_capacity"], HOP_LENGTH, FRAME_LENGTH
+                    )
+                    for position, crepe_result in zip(tracked, adaptive_results):
+                        crepe_results[position] = crepe_result
+                else:
+                    crepe_results = run_crepe_batch(
+                        prepared, sr, crepe_step_size_ms(sr), options["model_capacity"]
+                    )
+        except Exception as e:
+            # Each clip falls back to its own CREPE call
+            logger.error(f"Batched CREPE failed: {str(e)}")
+        # Every clip in the group waited for the whole batched call
+        for index, _ in group:
+            timers[index].add("crepe_batch", batch_timer.stages.get("crepe_batch", 0.0))
+
+    for (index, (_, _, audio_digest)), y, S, crepe_result, pitch_result in zip(
+            group, prepared, spectrograms, crepe_results, pitch_results):
+        try:
+            with timers[index].activate():
+                result, report = transcribe_prepared(y, sr, options, crepe_result, S, pitch_result)
+                _store_result(cache, audio_digest, options, result, report)
+        except Exception as e:
+            logger.error(f"Batch item {index} failed: {str(e)}")
+            result = _error_payload(e)
+        finish(index, result)
+
+def _triangle(half_width):
+    kernel = np.concatenate([np.arange(1, half_width + 2), np.arange(half_width, 0, -1)]).astype(np.float32)
+    return kernel / kernel.sum()
+
+def spectral_gate(y, sr, n_fft=2048, hop_length=HOP_LENGTH, n_std_thresh=1.5, prop_decrease=0.5,
+                  freq_smooth_hz=500, time_smooth_ms=50):
+    """Stationary spectral gating on the analysis STFT.
+
+    Same scheme as noisereduce's stationary mode: bins below a per-frequency
+    threshold (mean + n_std_thresh * std in dB) are attenuated by
+    prop_decrease, with the mask smoothed by a triangular window over
+    freq_smooth_hz and time_smooth_ms. Returns the denoised signal and its
+    magnitude spectrogram, which extract_features can use instead of
+    computing its own STFT.
+    """
+    D = librosa.stft(y, n_fft=n_fft, hop_length=hop_length)
+    S = np.abs(D)
+    S_db = librosa.amplitude_to_db(S, ref=1.0)
+    thresh = S_db.mean(axis=1, keepdims=True) + n_std_thresh * S_db.std(axis=1, keepdims=True)
+    mask = (S_db > thresh).astype(np.float32)
+    del S_db
+
+    freq_bins = max(1, int(freq_smooth_hz / (sr / (n_fft / 2))))
+    time_frames = max(1, int(time_smooth_ms / (hop_length / sr * 1000)))
+    mask = convolve1d(mask, _triangle(freq_bins), axis=0, mode="constant")
+    mask = convolve1d(mask, _triangle(time_frames), axis=1, mode="constant")
+
+    gain = 1 - prop_decrease * (1 - mask)
+    D *= gain
+    S *= gain
+    return librosa.istft(D, hop_length=hop_length, length=len(y)), S
+
+def denoise_signal(y, sr, denoise="noisereduce"):
+    """Run the selected noise reduction; returns (signal, spectrogram or None)"""
+    with timed("noise_reduction"):
+        if denoise == "spectral":
+            return spectral_gate(y, sr)
+        if denoise == "noisereduce":
+            y = nr.reduce_noise(
+                y=y, sr=sr, stationary=True, prop_decrease=0.5,
+                chunk_size=int(DENOISE_CHUNK_SECONDS * sr), n_jobs=1
+            )
+        return y, None
+
+def prepare_signal(y, sr, denoise="noisereduce"):
+    """Noise reduction and peak normalization ahead of analysis.
+
+    Returns (signal, spectrogram); the spectrogram is the magnitude STFT of
+    the returned signal when the denoiser produced one, else None.
+    """
+    y, S = denoise_signal(y, sr, denoise)
+    peak = _peak(y)
+    if peak > 0:
+        y = y / peak
+        if S is not None:
+            S /= peak
+    return y, S
+
+def _peak(y, block=DECODE_BLOCK_BYTES // np.dtype(np.float32).itemsize):
+    """Max absolute sample, read blockwise so memory-mapped input is not copied"""
+    return max((float(np.max(np.abs(y[i:i + block]))) for i in range(0, len(y), block)), default=0.0)
+
+def _should_chunk(y, sr, options):
+    chunk_seconds = options["chunk_seconds"]
+    return chunk_seconds > 0 and len(y) > (chunk_seconds + 2 * CHUNK_OVERLAP_SECONDS) * sr
+
+def transcribe(y, sr, options):
+    """Turn a decoded mono signal into notes; returns (result, report)"""
+    if _should_chunk(y, sr, options):
+        return transcribe_chunked(y, sr, options)
+    y, S = prepare_signal(y, sr, options["denoise"])
+    return transcribe_prepared(y, sr, options, spectrogram=S)
+
+def transcribe_prepared(y, sr, options, crepe_result=None, spectrogram=None, pitch_result=None):
+    """Transcribe a signal that already went through prepare_signal"""
+    report = {}
+    notes = extract_raw_notes(y, sr, options, report, crepe_result, spectrogram, pitch_result)
+    return _finish_notes(notes, len(y) / sr, options), report
+
+def _scratch_array(length, dtype):
+    """Zeroed array backed by an unlinked temp file instead of anonymous memory"""
+    with tempfile.TemporaryFile(prefix="hummify-frames-") as f:
+        return np.memmap(f, dtype=dtype, mode="w+", shape=(max(length, 1),))[:length]
+
+def transcribe_chunked(y, sr, options):
+    """Transcribe a long signal window by window with roughly constant memory.
+
+    Each window of chunk_seconds gets CHUNK_OVERLAP_SECONDS of context on
+    both sides and goes through denoising, pitch tracking and feature
+    extraction on its own; only the frames of its core region are copied
+    into full-length, memory-mapped frame tracks. Boundary detection (with
+    its global RMS threshold), segmentation and corrections then run once
+    over the stitched tracks, so notes that cross a window seam come out
+    whole.
+
+    As in prepare_signal, levels are relative to the peak after denoising.
+    That peak is only known once every window is done, so each window is
+    analyzed scaled to the loudest denoised window so far, its RMS and flux
+    are stored unscaled, and both are divided by the final peak at the end.
+    """
+    hop_length = HOP_LENGTH
+    n_frames = 1 + len(y) // hop_length
+    core = max(1, int(options["chunk_seconds"] * sr) // hop_length)
+    overlap = int(CHUNK_OVERLAP_SECONDS * sr) // hop_length
+    peak = 0.0
+    logger.info(f"Chunked analysis: {-(-n_frames // core)} windows of {options['chunk_seconds']}s")
+
+    report = {}
+    tracks = {}
+    for core_start in range(0, n_frames, core):
+        core_end = min(core_start + core, n_frames)
+        window_start = max(0, core_start - overlap)
+        window_end = min(n_frames, core_end + overlap)
+
+        window = np.array(y[window_start * hop_length:window_end * hop_length], dtype=np.float32)
+        window, S = denoise_signal(window, sr, options["denoise"])
+        peak = max(peak, _peak(window))
+        scale = 1.0 / peak if peak > 0 else 1.0
+        window = window * scale
+        if S is not None:
+            S *= scale
+
+        f0, confidences, features = extract_frame_tracks(window, sr, options, report, spectrogram=S)
+        window_tracks = {
+            "f0": f0, "confidences": confidences, "onset_env": features["onset_env"],
+            "spectral_flux": features["spectral_flux"] / scale, "rms": features["rms"] / scale,
+        }
+        core_frames = slice(core_start - window_start, core_end - window_start)
+        for name, values in window_tracks.items():
+            if name not in tracks:
+                tracks[name] = _scratch_array(n_frames, values.dtype)
+            tracks[name][core_start:core_end] = values[core_frames]
+
+    if peak > 0:
+        for name in ("spectral_flux", "rms"):
+            tracks[name] /= peak
+
+    logger.info("Detecting note boundaries over the stitched tracks")
+    with timed("boundaries"):
+        boundaries = detect_note_boundaries(y, sr, hop_length, FRAME_LENGTH, tracks)
+
+    with timed("segmentation"):
+        notes = segment_notes(
+            boundaries, tracks["f0"], tracks["confidences"], tracks["rms"], sr, hop_length, len(y) / sr
+        )
+    return _finish_notes(notes, len(y) / sr, options), report
+
+def _finish_notes(notes, total_duration, options):
+    """Apply the musical corrections and build the JSON result"""
+    logger.info(f"Created {len(notes)} raw notes")
+    
+    with timed("corrections"):
+        final_notes = apply_musical_corrections(notes, **options["corrections"])
+    
+    if len(final_notes):
+        coverage = final_notes["end"][-1] / total_duration
+        logger.info(f"Audio coverage: {coverage:.1%}")
+    else:
+        logger.warning("No notes generated")
+    
+    logger.info(f"Final note count: {len(final_notes)}")
+    
+    # Output with "notes" key instead of "data"
+    return {
+        "success": True,
+        "notes": notes_to_dicts(final_notes)
+    }
+
+def extract_raw_notes(y, sr, options, report=None, crepe_result=None, spectrogram=None, pitch_result=None):
+    """Pitch tracking, boundary detection and segmentation on a prepared signal"""
+    hop_length = HOP_LENGTH
+    frame_length = FRAME_LENGTH
+    f0, confidences, features = extract_frame_tracks(
+        y, sr, options, report, crepe_result, spectrogram, pitch_result
+    )
+    
+    logger.info("Detecting note boundaries with tuned parameters")
+    with timed("boundaries"):
+        boundaries = detect_note_boundaries(y, sr, hop_length, frame_length, features)
+    
+    logger.info("Creating note segments")
+    with timed("segmentation"):
+        notes = segment_notes(boundaries, f0, confidences, features["rms"], sr, hop_length, len(y) / sr)
+    return notes
+
+def extract_frame_tracks(y, sr, options, report=None, crepe_result=None, spectrogram=None, pitch_result=None):
+    """Per-frame pitch, confidence and spectral features; returns (f0, confidences, features)"""
+    hop_length = HOP_LENGTH
+    frame_length = FRAME_LENGTH
+    
+    logger.info("Running optimized pitch detection")
+    f0, confidences, frame_times = get_vocal_pitch(
+        y, sr, frame_length, hop_length,
+        model_capacity=options["model_capacity"],
+        crepe_backend=options["crepe_backend"],
+        crepe_timeout=options["crepe_timeout"],
+        fusion=options["fusion"],
+        report=report,
+        crepe_result=crepe_result,
+        quality=options["quality"],
+        pitch_tracker=options["pitch_tracker"],
+        pitch_result=pitch_result
+    )
+    
+    logger.info("Extracting spectral features")
+    with timed("features"):
+        features = extract_features(y, sr, hop_length, frame_length, S=spectrogram)
+    return f0, confidences, features
+
+def segment_notes(boundaries, f0, confidences, rms_energy, sr, hop_length, total_duration):
+    """Turn boundary-delimited segments into a raw NOTE_DTYPE array, all segments at once"""
+    n_frames = len(f0)
+    starts = np.asarray(boundaries[:-1], dtype=float)
+    ends = np.asarray(boundaries[1:], dtype=float)
+    frame_starts = np.clip(np.floor(starts * sr / hop_length).astype(int), 0, n_frames)
+    frame_ends = np.clip(np.ceil(ends * sr / hop_length).astype(int), 0, n_frames)
+
+    # Audio after the last boundary becomes a final segment up to the last frame
+    if boundaries[-1] < total_duration:
+        starts = np.append(starts, boundaries[-1])
+        ends = np.append(ends, total_duration)
+        frame_starts = np.append(frame_starts, min(n_frames, int(np.floor(boundaries[-1] * sr / hop_length))))
+        frame_ends = np.append(frame_ends, n_frames)
+
+    durations = ends - starts
+    keep = (durations >= 0.08) & (frame_starts < frame_ends)
+    starts, ends = starts[keep], ends[keep]
+    frame_starts, frame_ends = frame_starts[keep], frame_ends[keep]
+    n_segments = len(starts)
+    if not n_segments:
+        return empty_notes()
+
+    seg_ids, frame_idx, offsets = _segment_frames(frame_starts, frame_ends)
+    seg_rms = rms_energy[frame_idx]
+    mean_rms = np.add.reduceat(seg_rms, offsets) / (frame_ends - frame_starts)
+
+    pitch_hz, pitch_conf, has_pitch = segment_dominant_pitch(
+        f0, confidences, seg_ids, frame_idx, n_segments
+    )
+    voiced = (mean_rms >= 0.001) & has_pitch & (pitch_conf >= 0.4)
+    if not voiced.any():
+        return empty_notes()
+
+    rms_p75 = segment_percentiles(seg_rms, seg_ids, n_segments, 75)
+
+    notes = empty_notes(int(voiced.sum()))
+    notes["pitch"] = np.round(librosa.hz_to_midi(pitch_hz[voiced]))
+    notes["start"] = starts[voiced]
+    notes["end"] = ends[voiced]
+    notes["volume"] = np.interp(rms_p75[voiced], [0.001, 0.3], [40, 127]).astype(int)
+    return notes
+
+def _error_payload(e):
+    return {
+        "success": False,
+        "error": str(e),
+        "traceback": traceback.format_exc()
+    }
+
+def run_worker(defaults=None):
+    """Serve analysis jobs as newline-delimited JSON over stdin/stdout.
+
+    Each input line is {"id": ..., "audio_url": ...}; each output line is the
+    usual result payload with the job id echoed back. A job with "audio_urls"
+    instead runs analyze_batch and replies with {"success": true, "results": [...]}. The process stays alive
+    between jobs so TensorFlow, CREPE and librosa are only imported once.
+    An optional "options" object overrides the worker's default options.
+    A job with "stream_socket" runs a live transcription session over that
+    Unix socket (see streaming.stream_session) with the streaming defaults.
+    """
+    defaults = resolve_options(defaults)
+    if defaults["crepe_backend"] == "inprocess":
+        logger.info(f"Preloading CREPE '{defaults['model_capacity']}' model")
+        load_crepe_model(defaults["model_capacity"])
+    logger.info("Analysis worker ready")
+    _write_message({"ready": True, "pid": os.getpid()})
+
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+
+        job_id = None
+        try:
+            job = json.loads(line)
+            job_id = job.get("id")
+            logger.info(f"Worker received job {job_id}")
+            options = dict(defaults, **(job.get("options") or {}))
+            if "stream_socket" in job:
+                from streaming import stream_session
+                result = stream_session(job["stream_socket"], job.get("options"))
+            elif "audio_urls" in job:
+                result = {"success": True, "results": analyze_batch(job["audio_urls"], options)}
+            else:
+                result = analyze_audio(job["audio_url"], options)
+        except Exception as e:
+            logger.error(f"Worker job {job_id} failed: {str(e)}")
+            result = _error_payload(e)
+
+        result["id"] = job_id
+        _write_message(result)
+
+    logger.info("Analysis worker stdin closed, exiting")
+
+def _write_message(message):
+    sys.stdout.write(json.dumps(message) + "\n")
+    sys.stdout.flush()
+
+def run_batch(audio_urls, options):
+    """Analyze a list of URLs/files, writing one NDJSON line per item as it finishes"""
+    def emit(index, result):
+        _write_message(dict(result, index=index, audio_url=audio_urls[index]))
+
+    results = analyze_batch(audio_urls, options, on_result=emit)
+    failed = sum(1 for result in results if not result.get("success"))
+    _write_message({"done": True, "count": len(results), "failed": failed})
+    return failed
+
 def main():
+    global METRICS_FILE, PROFILE_DIR
     parser = argparse.ArgumentParser(description='Convert audio to MIDI-like note data')
-    parser.add_argument("audio_url", help="Cloudinary audio URL")
+    parser.add_argument("audio_urls", nargs="*", metavar="audio_url",
+                        help="Cloudinary audio URL or local file (several with --batch)")
+    parser.add_argument("--worker", action="store_true",
+                        help="Stay resident and read NDJSON jobs from stdin")
+    parser.add_argument("--batch", action="store_true",
+                        help="Analyze many inputs (args, or one per stdin line) with batched CREPE")
+    parser.add_argument("--model-capacity", choices=CREPE_MODEL_CAPACITIES,
+                        default=DEFAULT_OPTIONS["model_capacity"], help="CREPE model size")
+    parser.add_argument("--crepe-backend", choices=("inprocess", "process"),
+                        default=DEFAULT_OPTIONS["crepe_backend"],
+                        help="Run CREPE on the resident model or in a spawned process")
+    parser.add_argument("--crepe-timeout", type=float, default=DEFAULT_OPTIONS["crepe_timeout"],
+                        help="Seconds before CREPE is abandoned and PYIN is used alone")
+    parser.add_argument("--fusion", choices=sorted(FUSION_STRATEGIES),
+                        default=DEFAULT_OPTIONS["fusion"],
+                        help="How PYIN and CREPE pitch tracks are merged")
+    parser.add_argument("--pitch-tracker", choices=sorted(PITCH_TRACKERS),
+                        default=DEFAULT_OPTIONS["pitch_tracker"],
+                        help="Frame pitch tracker: librosa PYIN, or the faster vectorized YIN")
+    parser.add_argument("--quality", choices=QUALITY_TIERS, default=DEFAULT_OPTIONS["quality"],
+                        help="fast = PYIN only, adaptive = CREPE where PYIN is unsure, full = CREPE everywhere")
+    parser.add_argument("--ingest", choices=("stream", "file"), default=DEFAULT_OPTIONS["ingest"],
+                        help="Decode while downloading, or download to a file first")
+    parser.add_argument("--denoise", choices=DENOISE_MODES, default=DEFAULT_OPTIONS["denoise"],
+                        help="Noise reduction before analysis: none, fast spectral gate, or noisereduce")
+    parser.add_argument("--chunk-seconds", type=float, default=DEFAULT_OPTIONS["chunk_seconds"],
+                        help="Analyze longer recordings in windows of this many seconds (0 = never)")
+    parser.add_argument("--key", help="Snap notes to this key's scale, e.g. 'C major' or 'F# minor'")
+    parser.add_argument("--fill-gap", type=float, default=CORRECTION_PARAMS["fill_gap"],
+                        help="Close silences up to this many seconds between kept notes")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Bypass the on-disk analysis result cache")
+    parser.add_argument("--metrics-file", default=METRICS_FILE,
+                        help="Append per-request stage timings to this file as JSON lines")
+    parser.add_argument("--profile", action="store_true",
+                        help="Dump a cProfile of each request into --profile-dir")
+    parser.add_argument("--profile-dir", default=PROFILE_DIR, help="Where --profile dumps go")
     args = parser.parse_args()
 
+    METRICS_FILE = args.metrics_file
+    PROFILE_DIR = args.profile_dir
+
+    options = {
+        "model_capacity": args.model_capacity,
+        "crepe_backend": args.crepe_backend,
+        "crepe_timeout": args.crepe_timeout,
+        "fusion": args.fusion,
+        "cache": not args.no_cache,
+        "ingest": args.ingest,
+        "profile": args.profile,
+        "corrections": {"key": args.key, "fill_gap": args.fill_gap},
+        "denoise": args.denoise,
+        "chunk_seconds": args.chunk_seconds,
+        "quality": args.quality,
+        "pitch_tracker": args.pitch_tracker,
+    }
+
+    if args.worker:
+        run_worker(options)
+        return
+    if args.batch:
+        audio_urls = args.audio_urls or [line.strip() for line in sys.stdin if line.strip()]
+        sys.exit(1 if run_batch(audio_urls, options) else 0)
+    if len(args.audio_urls) != 1:
+        parser.error("exactly one audio_url is required unless --worker or --batch is given")
+
     try:
-        with tempfile.TemporaryDirectory() as tmpdir:
-            logger.info(f"Created temporary directory: {tmpdir}")
-            
-            ext = os.path.splitext(args.audio_url)[1] or ".webm"
-            input_path = os.path.join(tmpdir, f"input{ext}")
-            output_path = os.path.join(tmpdir, "converted.wav")
-            
-            if not download_audio(args.audio_url, input_path):
-                raise Exception("Audio download failed")
-            if not convert_to_wav(input_path, output_path):
-                raise Exception("Audio conversion failed")
-            
-            logger.info("Loading and processing audio")
-            y, sr = librosa.load(output_path, sr=None, mono=True)
-            duration = len(y)/sr
-            logger.info(f"Audio loaded: {len(y)} samples, {duration:.2f} seconds, SR: {sr}Hz")
-            
-            y = nr.reduce_noise(y=y, sr=sr, stationary=True, prop_decrease=0.5)
-            y = librosa.util.normalize(y)
-            
-            hop_length = 256
-            frame_length = 1024
-            
-            logger.info("Running optimized pitch detection")
-            f0, confidences, frame_times = get_vocal_pitch(y, sr, frame_length, hop_length)
-            n_frames = len(f0)
-            
-            logger.info("Detecting note boundaries with tuned parameters")
-            boundaries = detect_note_boundaries(y, sr, hop_length, frame_length)
-            
-            logger.info("Creating note segments")
-            rms_energy = librosa.feature.rms(y=y, frame_length=frame_length, hop_length=hop_length)[0]
-            notes = []
-            
-            total_duration = len(y) / sr
-            
-            for i in range(len(boundaries) - 1):
-                start = boundaries[i]
-                end = boundaries[i+1]
-                dur = end - start
-                
-                if dur < 0.08:
-                    continue
-                
-                frame_start = max(0, min(n_frames, int(np.floor(start * sr / hop_length))))
-                frame_end = max(0, min(n_frames, int(np.ceil(end * sr / hop_length))))
-                
-                if frame_start >= frame_end:
-                    continue
-                
-                segment_rms = rms_energy[frame_start:frame_end]
-                
-                if np.mean(segment_rms) < 0.001:
-                    continue
-                
-                pitch_hz, pitch_confidence = get_dominant_pitch(f0, confidences, frame_start, frame_end)
-                if pitch_hz is None or pitch_confidence < 0.4:
-                    continue
-                
-                volume = int(np.interp(np.percentile(segment_rms, 75), 
-                                    [0.001, 0.3], [40, 127]))
-                
-                midi_num = librosa.hz_to_midi(pitch_hz)
-                quantized_midi = round(midi_num)
-                note_name = librosa.midi_to_note(quantized_midi, cents=False)
-                
-                notes.append({
-                    "note": note_name,
-                    "start": round(start, 3),
-                    "end": round(end, 3),
-                    "duration": round(dur, 3),
-                    "volume": volume
-                })
-            
-            if boundaries[-1] < total_duration:
-                end_time = total_duration
-                dur = end_time - boundaries[-1]
-                if dur >= 0.08:
-                    frame_start = max(0, min(n_frames, int(np.floor(boundaries[-1] * sr / hop_length))))
-                    frame_end = n_frames
-                    
-                    segment_rms = rms_energy[frame_start:frame_end]
-                    if np.mean(segment_rms) >= 0.001:
-                        pitch_hz, pitch_confidence = get_dominant_pitch(f0, confidences, frame_start, frame_end)
-                        if pitch_hz is not None and pitch_confidence >= 0.4:
-                            volume = int(np.interp(np.percentile(segment_rms, 75), 
-                                                [0.001, 0.3], [40, 127]))
-                            midi_num = librosa.hz_to_midi(pitch_hz)
-                            quantized_midi = round(midi_num)
-                            note_name = librosa.midi_to_note(quantized_midi, cents=False)
-                            
-                            notes.append({
-                                "note": note_name,
-                                "start": round(boundaries[-1], 3),
-                                "end": round(end_time, 3),
-                                "duration": round(dur, 3),
-                                "volume": volume
-                            })
-            
-            logger.info(f"Created {len(notes)} raw notes")
-            
-            final_notes = apply_musical_corrections(
-                notes,
-                min_gap=0.05,
-                min_duration=0.08,
-                max_pitch_diff=0.5,
-                min_volume_diff=10
-            )
-            
-            if final_notes:
-                coverage = final_notes[-1]['end'] / total_duration
-                logger.info(f"Audio coverage: {coverage:.1%}")
-            else:
-                logger.warning("No notes generated")
-            
-            logger.info(f"Final note count: {len(final_notes)}")
-            
-            # Output with "notes" key instead of "data"
-            output = {
-                "success": True,
-                "notes": final_notes
-            }
-            print(json.dumps(output, indent=2))
-    
+        output = analyze_audio(args.audio_urls[0], options)
+        print(json.dumps(output, separators=(",", ":")))
+
     except Exception as e:
         # Error output with success=false
-        error_info = {
-            "success": False,
-            "error": str(e),
-            "traceback": traceback.format_exc()
-        }
-        print(json.dumps(error_info, indent=2))
+        print(json.dumps(_error_payload(e), separators=(",", ":")))
         sys.exit(1)
 
 if __name__ == "__main__":
     multiprocessing.set_start_method('spawn')
+    # streaming.py imports from "audiotonotes"; let it reuse this module
+    sys.modules.setdefault("audiotonotes", sys.modules[__name__])
     main()
\ No newline at end of file
@@ -0,0 +1,295 @@
+"""Reproducible benchmark for the transcription and synthesis pipelines.
+
+Synthetic hummed melodies with known notes are generated from fixed seeds,
+each case runs in its own child process (so peak RSS is per case), and the
+report covers wall time per stage, peak RSS and note accuracy against the
+ground truth. Results are written to benchmarks/results/<commit>.json so
+runs can be compared across commits:
+
+    python benchmark.py                      # quick fixture set
+    python benchmark.py --fixtures full      # adds the 1 and 10 minute cases
+    python benchmark.py --option fusion=pyin --compare benchmarks/results/abc123.json
+    python benchmark.py --option pitch_tracker=yin --compare benchmarks/results/abc123.json
+    python benchmark.py --check-stream       # held tone through streaming.py
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+SR = 22050
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(SCRIPT_DIR, "..", "benchmarks", "results")
+
+# name -> melody length (s), vibrato depth (cents), SNR (dB, None = clean), seed
+CASES = {
+    "clean_2s": {"seconds": 2, "vibrato_cents": 0, "snr_db": None, "seed": 1},
+    "clean_10s": {"seconds": 10, "vibrato_cents": 0, "snr_db": None, "seed": 2},
+    "vibrato_10s": {"seconds": 10, "vibrato_cents": 40, "snr_db": None, "seed": 3},
+    "noisy_10s": {"seconds": 10, "vibrato_cents": 20, "snr_db": 15, "seed": 4},
+    "long_60s": {"seconds": 60, "vibrato_cents": 20, "snr_db": 25, "seed": 5},
+    "session_10min": {"seconds": 600, "vibrato_cents": 20, "snr_db": 25, "seed": 6},
+}
+FIXTURE_SETS = {
+    "quick": ["clean_2s", "clean_10s", "vibrato_10s", "noisy_10s"],
+    "full": list(CASES),
+}
+
+def generate_melody(seconds, seed):
+    """Random-walk melody as (midi, start, end) tuples filling `seconds`"""
+    rng = np.random.default_rng(seed)
+    notes = []
+    t = 0.2
+    midi = int(rng.integers(52, 68))
+    while True:
+        duration = float(rng.choice([0.25, 0.35, 0.5, 0.75]))
+        if t + duration > seconds - 0.2:
+            break
+        notes.append((midi, round(t, 3), round(t + duration, 3)))
+        t += duration + float(rng.uniform(0.05, 0.15))
+        midi = int(np.clip(midi + rng.integers(-4, 5), 48, 72))
+    return notes
+
+def render_hum(notes, seconds, vibrato_cents=0, vibrato_hz=5.5, snr_db=None, seed=0, sr=SR):
+    """Hum-like harmonic tones with attack/release envelopes, vibrato and noise"""
+    rng = np.random.default_rng(seed + 1000)
+    y = np.zeros(int(seconds * sr), dtype=np.float64)
+    harmonics = [1.0, 0.5, 0.3, 0.15, 0.08]
+
+    for midi, start, end in notes:
+        n = int((end - start) * sr)
+        t = np.arange(n) / sr
+        f0 = 440.0 * 2 ** ((midi - 69) / 12)
+        freq = f0 * 2 ** (vibrato_cents * np.sin(2 * np.pi * vibrato_hz * t) / 1200)
+        phase = 2 * np.pi * np.cumsum(freq) / sr
+        tone = sum(a * np.sin(k * phase) for k, a in enumerate(harmonics, 1))
+        envelope = np.minimum(1.0, np.minimum(t / 0.03, (t[-1] - t) / 0.06))
+        offset = int(start * sr)
+        y[offset:offset + n] += 0.3 * tone * envelope
+
+    if snr_db is not None:
+        signal_rms = np.sqrt(np.mean(y ** 2))
+        y += rng.normal(0, signal_rms / 10 ** (snr_db / 20), len(y))
+    return y.astype(np.float32)
+
+def build_case(name):
+    case = CASES[name]
+    notes = generate_melody(case["seconds"], case["seed"])
+    y = render_hum(notes, case["seconds"], case["vibrato_cents"], snr_db=case["snr_db"], seed=case["seed"])
+    return y, notes
+
+def _note_midi(note):
+    if "midi" in note:
+        return int(note["midi"])
+    from notes import parse_note_name
+    return parse_note_name(note["note"])[0]
+
+def score_notes(estimated, reference, onset_tolerance=0.1):
+    """Greedy note matching: onset within tolerance, with and without pitch"""
+    def f1(matched):
+        precision = matched / len(estimated) if estimated else 0.0
+        recall = matched / len(reference) if reference else 0.0
+        total = precision + recall
+        return round(2 * precision * recall / total, 4) if total else 0.0
+
+    est = [(_note_midi(n), n["start"]) for n in estimated]
+
+    def count(match_pitch):
+        used = set()
+        matched = 0
+        for ref_midi, ref_start, _ in reference:
+            for i, (est_midi, est_start) in enumerate(est):
+                if i in used or abs(est_start - ref_start) > onset_tolerance:
+                    continue
+                if match_pitch and est_midi != ref_midi:
+                    continue
+                used.add(i)
+                matched += 1
+                break
+        return matched
+
+    note_matches = count(True)
+    onset_matches = count(False)
+    return {
+        "reference_notes": len(reference),
+        "estimated_notes": len(estimated),
+        "note_f1": f1(note_matches),
+        "onset_f1": f1(onset_matches),
+        "pitch_accuracy": round(note_matches / onset_matches, 4) if onset_matches else 0.0,
+    }
+
+def run_synth(notes, instrument="piano"):
+    """Run synth.py end to end in a scratch directory; returns timing and status.
+
+    The render cache is off: the seeded notes repeat on every run, so later
+    runs would otherwise time cache hits instead of renders.
+    """
+    with tempfile.TemporaryDirectory() as workdir:
+        start = time.perf_counter()
+        process = subprocess.run(
+            [sys.executable, os.path.join(SCRIPT_DIR, "synth.py"), instrument],
+            input=json.dumps(notes), capture_output=True, text=True, cwd=workdir,
+            env=dict(os.environ, SYNTH_CACHE_MAX_MB="0")
+        )
+        wall = time.perf_counter() - start
+
+    try:
+        output = json.loads(process.stdout.strip().splitlines()[-1])
+    except (ValueError, IndexError):
+        output = {"status": "error", "message": process.stderr[-500:]}
+    return {
+        "status": output.get("status"),
+        "error": output.get("message") if output.get("status") != "success" else None,
+        "wall_s": round(wall, 4),
+        "timings": output.get("timings"),
+    }
+
+def run_case(name, options, with_synth):
+    """Run one case in this process and return its measurements"""
+    start = time.perf_counter()
+    import audiotonotes
+    from timing import StageTimer
+    import_s = time.perf_counter() - start
+
+    y, reference = build_case(name)
+    options = audiotonotes.resolve_options(dict(options, cache=False))
+
+    timer = StageTimer()
+    with timer.activate():
+        result, _ = audiotonotes.transcribe(y, SR, options)
+
+    measurement = {
+        "case": name,
+        "audio_s": round(len(y) / SR, 3),
+        "import_s": round(import_s, 4),
+        "timings": timer.as_dict(),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "accuracy": score_notes(result["notes"], reference),
+    }
+    measurement["realtime_factor"] = round(measurement["timings"]["total"] / measurement["audio_s"], 4)
+    if with_synth and result["notes"]:
+        measurement["synth"] = run_synth(result["notes"])
+    return measurement
+
+def check_stream_held_tone(seconds=20, chunk_sizes=(1024, 4096, 11025, 22050)):
+    """Push one held tone through StreamingTranscriber at several chunk sizes.
+
+    A note longer than max_window is split and rejoined by the transcriber,
+    so each chunk size must still yield a single note spanning the tone.
+    Returns a list of failure messages (empty when every size passes).
+    """
+    from streaming import StreamingTranscriber
+
+    t = np.arange(int(seconds * SR)) / SR
+    y = (0.5 * np.sin(2 * np.pi * 220.0 * t)).astype(np.float32)
+    failures = []
+    for chunk in chunk_sizes:
+        transcriber = StreamingTranscriber(sr=SR)
+        notes = [transcriber.push(y[i:i + chunk]) for i in range(0, len(y), chunk)]
+        notes = np.concatenate(notes + [transcriber.flush()])
+        spans = [(round(float(n["start"]), 3), round(float(n["end"]), 3)) for n in notes]
+        if len(spans) != 1 or spans[0][0] > 0.1 or spans[0][1] < seconds - 0.2:
+            failures.append(f"chunk {chunk}: expected one note over 0-{seconds}s, got {spans}")
+    return failures
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=SCRIPT_DIR, check=True
+        ).stdout.strip()
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return "unknown"
+
+def _parse_options(pairs):
+    options = {}
+    for pair in pairs:
+        key, _, value = pair.partition("=")
+        try:
+            options[key] = json.loads(value)
+        except ValueError:
+            options[key] = value
+    return options
+
+def print_report(report, baseline=None):
+    base = {m["case"]: m for m in (baseline or {}).get("cases", []) if "case" in m}
+    print(f"{'case':<15}{'audio s':>9}{'total s':>10}{'xRT':>8}{'RSS MB':>9}{'note F1':>9}{'synth s':>9}")
+    for m in report["cases"]:
+        if "error" in m:
+            print(f"{m['case']:<15} failed: {m['error']}")
+            continue
+        synth = m.get("synth", {}).get("wall_s", "-")
+        line = (f"{m['case']:<15}{m['audio_s']:>9}{m['timings']['total']:>10}"
+                f"{m['realtime_factor']:>8}{m['peak_rss_mb']:>9}{m['accuracy']['note_f1']:>9}{synth:>9}")
+        old = base.get(m["case"])
+        if old and "timings" in old:
+            time_delta = m["timings"]["total"] / old["timings"]["total"] - 1
+            f1_delta = m["accuracy"]["note_f1"] - old["accuracy"]["note_f1"]
+            line += f"   vs base: time {time_delta:+.1%}, F1 {f1_delta:+.3f}"
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the transcription and synthesis pipelines")
+    parser.add_argument("--fixtures", choices=sorted(FIXTURE_SETS), default="quick")
+    parser.add_argument("--cases", nargs="*", help="Run only these cases")
+    parser.add_argument("--option", action="append", default=[], metavar="KEY=VALUE",
+                        help="Analysis option override, e.g. fusion=pyin (repeatable)")
+    parser.add_argument("--no-synth", action="store_true", help="Skip the synth.py end-to-end run")
+    parser.add_argument("--output", help="Results file (default benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", help="Earlier results file to diff against")
+    parser.add_argument("--check-stream", action="store_true",
+                        help="Only check that streaming keeps a held tone as one note")
+    parser.add_argument("--run-case", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    options = _parse_options(args.option)
+
+    if args.check_stream:
+        failures = check_stream_held_tone()
+        for failure in failures:
+            print(failure, file=sys.stderr)
+        print("stream check " + ("failed" if failures else "passed"))
+        sys.exit(1 if failures else 0)
+
+    if args.run_case:
+        print(json.dumps(run_case(args.run_case, options, not args.no_synth)))
+        return
+
+    report = {
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "options": options,
+        "cases": [],
+    }
+    for name in args.cases or FIXTURE_SETS[args.fixtures]:
+        print(f"Running {name}...", file=sys.stderr)
+        command = [sys.executable, os.path.abspath(__file__), "--run-case", name]
+        command += [f"--option={pair}" for pair in args.option]
+        if args.no_synth:
+            command.append("--no-synth")
+        process = subprocess.run(command, capture_output=True, text=True, cwd=SCRIPT_DIR)
+        try:
+            report["cases"].append(json.loads(process.stdout.strip().splitlines()[-1]))
+        except (ValueError, IndexError):
+            report["cases"].append({"case": name, "error": process.stderr.strip()[-500:]})
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{report['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    print(f"Results saved to {output}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import re
+from functools import lru_cache
+
+import numpy as np
+
+# One row per note. Pitch is an integer MIDI number with an optional cents
+# offset; volume uses the MIDI velocity scale (1-127). Note names are only
+# produced or parsed at the JSON boundary.
+NOTE_DTYPE = np.dtype([
+    ("pitch", np.int16),
+    ("cents", np.int16),
+    ("start", np.float64),
+    ("end", np.float64),
+    ("volume", np.int16),
+])
+
+# Same spelling librosa.midi_to_note uses (unicode sharps)
+PITCH_CLASSES = ["C", "C♯", "D", "D♯", "E", "F", "F♯", "G", "G♯", "A", "A♯", "B"]
+MIDI_NOTE_NAMES = [f"{PITCH_CLASSES[m % 12]}{m // 12 - 1}" for m in range(128)]
+
+_SEMITONES = {"C": 0, "D": 2, "E": 4, "F": 5, "G": 7, "A": 9, "B": 11}
+_ACCIDENTALS = {"": 0, "#": 1, "♯": 1, "b": -1, "♭": -1, "##": 2, "bb": -2}
+_NOTE_RE = re.compile(r"^\s*([A-Ga-g])(##|bb|[#♯b♭]?)(-?\d+)([+-]\d+)?\s*$")
+_KEY_RE = re.compile(r"^\s*([A-Ga-g])([#♯b♭]?)\s*(major|minor|maj|min|m)?\s*$", re.IGNORECASE)
+
+SCALE_STEPS = {
+    "major": (0, 2, 4, 5, 7, 9, 11),
+    "minor": (0, 2, 3, 5, 7, 8, 10),
+}
+
+def empty_notes(n=0):
+    return np.zeros(n, dtype=NOTE_DTYPE)
+
+@lru_cache(maxsize=None)
+def parse_note_name(name):
+    """'C#4', 'D♭3' or 'C4+12' -> (midi pitch, cents)"""
+    match = _NOTE_RE.match(name)
+    if not match:
+        raise ValueError(f"Unrecognized note name: {name!r}")
+    letter, accidental, octave, cents = match.groups()
+    pitch = _SEMITONES[letter.upper()] + _ACCIDENTALS[accidental] + 12 * (int(octave) + 1)
+    return pitch, int(cents) if cents else 0
+
+@lru_cache(maxsize=None)
+def scale_pitches(key):
+    """'C major', 'F# minor' or 'Am' -> sorted array of in-scale MIDI pitches"""
+    match = _KEY_RE.match(key)
+    if not match:
+        raise ValueError(f"Unrecognized key: {key!r}")
+    letter, accidental, mode = match.groups()
+    mode = "minor" if mode and mode.lower() in ("minor", "min", "m") else "major"
+    tonic = _SEMITONES[letter.upper()] + _ACCIDENTALS[accidental]
+    steps = np.array(SCALE_STEPS[mode])
+    pitches = ((tonic + steps)[None, :] + 12 * np.arange(-1, 12)[:, None]).ravel()
+    return np.sort(pitches[(pitches >= 0) & (pitches < 128)])
+
+def snap_to_scale(pitch, key):
+    """Move fractional MIDI pitches to the nearest tone of `key`, ties going down"""
+    scale = scale_pitches(key)
+    upper = np.clip(np.searchsorted(scale, pitch), 1, len(scale) - 1)
+    lower = scale[upper - 1]
+    upper = scale[upper]
+    return np.where(pitch - lower <= upper - pitch, lower, upper)
+
+def note_name(pitch, cents=0):
+    name = MIDI_NOTE_NAMES[int(pitch)]
+    return f"{name}{int(cents):+d}" if cents else name
+
+def notes_from_dicts(note_dicts, default_volume=100):
+    """Parse JSON note objects once into a NOTE_DTYPE array sorted by start"""
+    notes = empty_notes(len(note_dicts))
+    for i, obj in enumerate(note_dicts):
+        if "pitch" in obj:
+            pitch, cents = int(obj["pitch"]), int(obj.get("cents", 0))
+        else:
+            pitch, cents = parse_note_name(obj["note"])
+        notes[i] = (pitch, cents, obj["start"], obj["end"], obj.get("volume", default_volume))
+    return notes[np.argsort(notes["start"], kind="stable")]
+
+def notes_to_dicts(notes):
+    """Render notes as the JSON objects the API returns"""
+    return [
+        {
+            "note": note_name(pitch, cents),
+            "start": round(start, 3),
+            "end": round(end, 3),
+            "duration": round(end - start, 3),
+            "volume": volume
+        }
+        for pitch, cents, start, end, volume in notes.tolist()
+    ]
@@ -0,0 +1,219 @@
+import argparse
+import json
+import socket
+import subprocess
+import sys
+import traceback
+
+import numpy as np
+
+from audiotonotes import (
+    DECODE_BLOCK_BYTES, FRAME_LENGTH, TARGET_SR,
+    apply_musical_corrections, extract_raw_notes, logger, resolve_options
+)
+from notes import empty_notes, notes_to_dicts
+
+class StreamingTranscriber:
+    """Incremental note transcription over a growing PCM buffer.
+
+    Audio is pushed in arbitrary-sized chunks. Every `step` seconds of new
+    audio the retained window is re-analyzed with the regular boundary and
+    pitch stages, and notes that end at least `lookahead` seconds before the
+    end of the window are finalized. Only `context` seconds before the last
+    finalized point are kept, so memory and per-step work stay bounded.
+
+    A note still sounding when the window reaches `max_window` seconds is
+    split at the horizon instead of waiting for its end, which would keep
+    the whole note in the buffer; the held-back note and its continuation
+    are joined again by the merge rules.
+
+    The last finalized note is held back until the next one arrives, so the
+    usual merge rules can still join a note that straddles two steps.
+    """
+
+    def __init__(self, sr=TARGET_SR, options=None, step=0.5, lookahead=0.3, context=2.0,
+                 max_window=6.0, start_slack=0.1):
+        # The vectorized YIN tracker without CREPE keeps each step well under
+        # `step` seconds; callers can opt into PYIN or CREPE
+        self.options = resolve_options(dict({"fusion": "pyin", "pitch_tracker": "yin"}, **(options or {})))
+        self.sr = sr
+        self.step = step
+        self.lookahead = lookahead
+        self.context = context
+        self.max_window = max_window
+        self.start_slack = start_slack
+
+        self.buffer = np.zeros(0, dtype=np.float32)
+        self.buffer_start = 0.0
+        self.committed = 0.0
+        self.peak = 1e-6
+        self.pending = None
+        self._unprocessed = 0
+        self._split_at = None
+
+    def push(self, samples):
+        """Add samples; returns any notes finalized by this chunk"""
+        samples = np.asarray(samples, dtype=np.float32)
+        self.buffer = np.concatenate([self.buffer, samples])
+        self._unprocessed += len(samples)
+
+        if self._unprocessed < self.step * self.sr:
+            return empty_notes()
+        return self._process(final=False)
+
+    def flush(self):
+        """Finalize everything left once the input has ended"""
+        notes = self._process(final=True)
+        if self.pending is not None:
+            notes = np.concatenate([notes, self.pending])
+            self.pending = None
+        return notes
+
+    def _process(self, final):
+        self._unprocessed = 0
+        if len(self.buffer) < 2 * FRAME_LENGTH:
+            return self._correct(empty_notes(), final)
+
+        # A running peak keeps volumes comparable from one window to the next
+        self.peak = max(self.peak, float(np.max(np.abs(self.buffer))))
+        y = self.buffer / self.peak
+        window_end = self.buffer_start + len(y) / self.sr
+        horizon = window_end if final else window_end - self.lookahead
+
+        notes = extract_raw_notes(y, self.sr, self.options)
+        notes["start"] = np.round(notes["start"] + self.buffer_start, 3)
+        notes["end"] = np.round(notes["end"] + self.buffer_start, 3)
+        # A note waiting at the commit point can be re-detected a few frames
+        # earlier in the next window; so can the continuation of a split note
+        slack = np.inf if self._split_at == self.committed else self.start_slack
+        straddling = ((notes["start"] < self.committed) & (notes["start"] >= self.committed - slack)
+                      & (notes["end"] > self.committed))
+        notes["start"][straddling] = self.committed
+        notes = notes[notes["start"] >= self.committed]
+
+        # Stop at the first note that runs past the horizon, unless waiting
+        # for it to end would grow the window past max_window
+        next_commit = horizon
+        late = np.flatnonzero(notes["end"] > horizon)
+        if len(late):
+            first_late = late[0]
+            if horizon - notes["start"][first_late] + self.context + self.step > self.max_window:
+                # Commit exactly at the stored end so the continuation is
+                # recognized by `_split_at == committed` on later steps
+                notes["end"][first_late] = np.round(horizon, 3)
+                notes = notes[:first_late + 1]
+                self._split_at = next_commit = notes["end"][first_late]
+            else:
+                next_commit = min(next_commit, notes["start"][first_late])
+                notes = notes[:first_late]
+        ready = notes
+
+        if len(ready):
+            next_commit = min(next_commit, max(ready["end"][-1], self.committed))
+        self.committed = max(self.committed, next_commit)
+
+        keep_from = max(self.buffer_start, self.committed - self.context)
+        drop = int((keep_from - self.buffer_start) * self.sr)
+        if drop > 0:
+            self.buffer = self.buffer[drop:]
+            self.buffer_start += drop / self.sr
+
+        return self._correct(ready, final)
+
+    def _correct(self, ready, final):
+        batch = ready if self.pending is None else np.concatenate([self.pending, ready])
+        self.pending = None
+        if not len(batch):
+            return batch
+
+        corrected = apply_musical_corrections(batch, **self.options["corrections"])
+        if not final and len(corrected):
+            self.pending = corrected[-1:]
+            corrected = corrected[:-1]
+        return corrected
+
+def _write_message(message):
+    sys.stdout.write(json.dumps(message) + "\n")
+    sys.stdout.flush()
+
+def run_stream(input_format="encoded", options=None, source=None, emit=_write_message):
+    """Read audio from stdin and write finalized notes to stdout as NDJSON.
+
+    With input_format="encoded" stdin is any container ffmpeg can read from
+    a pipe (e.g. MediaRecorder WebM chunks appended in order); with "f32le"
+    it is raw mono float32 PCM at TARGET_SR. `source` and `emit` replace
+    stdin and stdout (see stream_session). Returns the number of notes sent.
+    """
+    source = source or sys.stdin.buffer
+    transcriber = StreamingTranscriber(options=options)
+    decoder = None
+    sent = 0
+
+    if input_format == "encoded":
+        decoder = subprocess.Popen([
+            "ffmpeg", "-v", "error", "-i", "pipe:0",
+            "-ac", "1", "-ar", str(TARGET_SR), "-f", "f32le", "pipe:1"
+        ], stdin=source, stdout=subprocess.PIPE)
+        pcm = decoder.stdout
+    else:
+        pcm = source
+
+    emit({"ready": True})
+
+    pending = b""
+    while True:
+        data = pcm.read1(DECODE_BLOCK_BYTES)
+        if not data:
+            break
+        data = pending + data
+        usable = len(data) - len(data) % 4
+        pending = data[usable:]
+        notes = transcriber.push(np.frombuffer(data[:usable], dtype=np.float32))
+        if len(notes):
+            sent += len(notes)
+            emit({"notes": notes_to_dicts(notes)})
+
+    if decoder is not None and decoder.wait() != 0:
+        raise RuntimeError(f"FFmpeg stream decode failed with code {decoder.returncode}")
+
+    notes = transcriber.flush()
+    emit({"done": True, "notes": notes_to_dicts(notes)})
+    return sent + len(notes)
+
+def stream_session(socket_path, options=None, input_format="encoded"):
+    """Run one live session over a Unix socket instead of stdin/stdout.
+
+    The analysis workers serve {"stream_socket": ...} jobs with this: the
+    server writes the recording into the socket and half-closes it when the
+    take ends, and reads the same NDJSON messages as run_stream prints. The
+    job result only reports how many notes were sent as `note_count`.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        with sock.makefile("rb") as source, sock.makefile("wb") as out:
+            def emit(message):
+                out.write((json.dumps(message) + "\n").encode())
+                out.flush()
+
+            return {"success": True, "note_count": run_stream(input_format, options, source, emit)}
+
+def main():
+    parser = argparse.ArgumentParser(description='Transcribe notes incrementally from audio on stdin')
+    parser.add_argument("--format", choices=("encoded", "f32le"), default="encoded",
+                        help="Encoded container via ffmpeg, or raw float32 PCM")
+    parser.add_argument("--fusion", default="pyin", help="Pitch fusion strategy")
+    args = parser.parse_args()
+
+    try:
+        run_stream(args.format, {"fusion": args.fusion})
+    except Exception as e:
+        logger.error(f"Streaming transcription failed: {str(e)}")
+        _write_message({
+            "success": False,
+            "error": str(e),
+            "traceback": traceback.format_exc()
+        })
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
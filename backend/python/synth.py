@@ -1,11 +1,69 @@
+import argparse
 import sys
 import json
 import os
+import re
+import shutil
+import socket
+import struct
 import subprocess
+import tempfile
+import threading
+import time
+from functools import lru_cache
 import pretty_midi
-import re
 import numpy as np
+import soundfile as sf
+from audio_fx import post_process_blocks
+from disk_cache import DiskLRUCache, hash_key
+from notes import note_name, notes_from_dicts
+from timing import StageTimer, append_metrics, timed
+
+try:
+    import fluidsynth
+except ImportError:  # pyfluidsynth or libfluidsynth missing; render with the CLI instead
+    fluidsynth = None
+
+SOUNDFONT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "FluidR3_GM.sf2")
+SAMPLE_RATE = 44100
+SYNTH_GAIN = 0.8
+RELEASE_SECONDS = 1.0  # rendered past the last note-off so releases are not cut
+DRUM_CHANNEL = 9
+
+# "auto" uses the in-process synthesizer when pyfluidsynth is available
+SYNTH_ENGINE = os.environ.get("SYNTH_ENGINE", "auto")
+
+# format -> (file extension, ffmpeg encoder, default bitrate, ffmpeg muxer); WAV is written directly
+OUTPUT_FORMATS = {
+    "wav": (".wav", None, None, "wav"),
+    "opus": (".ogg", "libopus", "64k", "ogg"),
+    "ogg": (".ogg", "libvorbis", "96k", "ogg"),
+    "mp3": (".mp3", "libmp3lame", "128k", "mp3"),
+}
+ENCODE_BLOCK_SAMPLES = 65536
+# ~46 ms at 44.1 kHz; the unit streaming renders, processes and sends
+STREAM_BLOCK_SAMPLES = 2048
+
+# Finished audio files keyed by notes, program and render settings (see render_key)
+RENDER_CACHE_DIR = os.environ.get(
+    "SYNTH_CACHE_DIR", os.path.join(tempfile.gettempdir(), "hummify-render-cache")
+)
+RENDER_CACHE_MAX_MB = float(os.environ.get("SYNTH_CACHE_MAX_MB", "512"))
 
+# Edits to the renderer or the effects chain invalidate cached renders
+_CODE_VERSION_FILES = (__file__, os.path.join(os.path.dirname(os.path.abspath(__file__)), "audio_fx.py"))
+
+def _read_bytes(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+CODE_VERSION = hash_key(*(_read_bytes(path) for path in _CODE_VERSION_FILES))[:16]
+
+_synth = None
+_synth_lock = threading.Lock()
+_render_cache = None
+
+@lru_cache(maxsize=None)
 def check_fluidsynth_installation():
     try:
         subprocess.run(["fluidsynth", "--version"], capture_output=True, check=True)
@@ -20,13 +78,11 @@ def check_soundfont(sf2_path):
         return False
     return True 
 
-def notes_to_midi(note_objs, midi_path, program, is_drum=False):
+def build_midi(notes, program, is_drum=False):
+    """NOTE_DTYPE array (see notes_from_dicts) -> (PrettyMIDI, tempo)"""
     try:
-        # Sort notes by start time to ensure proper sequencing
-        note_objs = sorted(note_objs, key=lambda x: x["start"])
-        
         # Pre-calculate tempo based on note density
-        avg_note_duration = np.mean([n["duration"] for n in note_objs])
+        avg_note_duration = np.mean(notes["end"] - notes["start"])
         tempo = max(40, min(180, int(120 / (avg_note_duration + 0.1))))
         print(f"Using tempo: {tempo} BPM", file=sys.stderr)
 
@@ -34,42 +90,21 @@ def notes_to_midi(note_objs, midi_path, program, is_drum=False):
         pm = pretty_midi.PrettyMIDI(initial_tempo=tempo)
         instr = pretty_midi.Instrument(program=program, is_drum=is_drum)
 
-        for obj in note_objs:
-            raw_note = obj["note"]
-            # Extract base note and cents (e.g., "C4+12" -> ("C4", 12))
-            match = re.match(r"([A-Ga-g#♯b♭]+[0-9])([+-]\d+)", raw_note)
-            if match:
-                base_note = match.group(1)
-                cents = int(match.group(2))
-            else:
-                base_note = raw_note
-                cents = 0
-
-            # Convert to MIDI pitch number
-            try:
-                pitch = pretty_midi.note_name_to_number(base_note)
-            except ValueError:
-                # Try alternative naming if standard conversion fails
-                base_note = base_note.replace("♯", "#").replace("♭", "b")
-                pitch = pretty_midi.note_name_to_number(base_note)
-            
-            # Apply cents adjustment (1 cent = 1/100 semitone)
-            pitch += cents / 100.0
-            
-            start, end = obj["start"], obj["end"]
-            volume = obj.get("volume", 100)
-            velocity = max(1, min(127, int(volume)))
-            
-            # Humming-specific volume boost
-            if velocity < 80:
-                velocity = min(127, int(velocity * 1.4))
-            
-            print(f"Processing note: {base_note}{cents:+} -> {pitch:.2f}, "
+        # Apply cents adjustment (1 cent = 1/100 semitone), rounded to the nearest MIDI pitch
+        pitches = np.round(notes["pitch"] + notes["cents"] / 100.0).astype(int)
+        velocities = np.clip(notes["volume"], 1, 127).astype(int)
+        # Humming-specific volume boost
+        velocities = np.where(velocities < 80, np.minimum(127, (velocities * 1.4).astype(int)), velocities)
+
+        for pitch, start, end, velocity in zip(
+            pitches.tolist(), notes["start"].tolist(), notes["end"].tolist(), velocities.tolist()
+        ):
+            print(f"Processing note: {note_name(pitch)} -> {pitch}, "
                   f"start: {start:.3f}, end: {end:.3f}, velocity: {velocity}", file=sys.stderr)
 
             note = pretty_midi.Note(
                 velocity=velocity,
-                pitch=int(round(pitch)),  # Round to nearest integer for MIDI
+                pitch=pitch,
                 start=start,
                 end=end
             )
@@ -88,19 +123,100 @@ def notes_to_midi(note_objs, midi_path, program, is_drum=False):
             #     instr.control_changes.append(mod_event)
 
         pm.instruments.append(instr)
-        pm.write(midi_path)
-        print(f"Successfully wrote MIDI file to {midi_path}", file=sys.stderr)
-        return tempo
+        return pm, tempo
     except Exception as e:
-        print(f"Error in notes_to_midi: {str(e)}", file=sys.stderr)
+        print(f"Error in build_midi: {str(e)}", file=sys.stderr)
         raise
 
-def synthesize_audio(midi_path, wav_path, tempo):
+def notes_to_midi(note_objs, midi_path, program, is_drum=False):
+    pm, tempo = build_midi(notes_from_dicts(note_objs), program, is_drum)
+    pm.write(midi_path)
+    print(f"Successfully wrote MIDI file to {midi_path}", file=sys.stderr)
+    return tempo
+
+def get_synth():
+    """Process-wide FluidSynth instance with the soundfont loaded once"""
+    global _synth
+    if _synth is None:
+        if not check_soundfont(SOUNDFONT_PATH):
+            raise FileNotFoundError(f"Soundfont file not found at {SOUNDFONT_PATH}")
+        # Same settings as the CLI's -g 0.8 -C 0 -R 0
+        synth = fluidsynth.Synth(gain=SYNTH_GAIN, samplerate=float(SAMPLE_RATE),
+                                 **{"synth.chorus.active": 0, "synth.reverb.active": 0})
+        sfid = synth.sfload(SOUNDFONT_PATH)
+        if sfid == -1:
+            raise RuntimeError(f"FluidSynth could not load {SOUNDFONT_PATH}")
+        print(f"Loaded soundfont {SOUNDFONT_PATH} (pid {os.getpid()})", file=sys.stderr)
+        _synth = (synth, sfid)
+    return _synth
+
+def _midi_events(pm):
+    """(time, is_note_on, channel, pitch, velocity) for every note, with program setup per channel"""
+    events = []
+    programs = {}
+    melodic = (c for c in range(16) if c != DRUM_CHANNEL)
+    for instrument in pm.instruments:
+        channel = DRUM_CHANNEL if instrument.is_drum else next(melodic)
+        programs[channel] = (128 if instrument.is_drum else 0, instrument.program)
+        for note in instrument.notes:
+            events.append((note.start, 1, channel, note.pitch, note.velocity))
+            events.append((note.end, 0, channel, note.pitch, 0))
+    # Note-offs sort before note-ons at the same instant so repeated pitches retrigger
+    events.sort(key=lambda event: (event[0], event[1]))
+    return events, programs
+
+def iter_render_blocks(pm, block_samples=STREAM_BLOCK_SAMPLES, sample_rate=SAMPLE_RATE):
+    """Render a PrettyMIDI object with the resident synthesizer, yielding mono float64 blocks.
+
+    Note events are applied at their exact sample inside each block, so the
+    concatenated blocks are the same whatever the block size. The synth is
+    held for the lifetime of the generator.
+    """
+    synth, sfid = get_synth()
+    events, programs = _midi_events(pm)
+    total = int((pm.get_end_time() + RELEASE_SECONDS) * sample_rate)
+    targets = [min(total, int(round(event[0] * sample_rate))) for event in events]
+
+    with _synth_lock:
+        for channel, (bank, program) in programs.items():
+            synth.program_select(channel, sfid, bank, program)
+        try:
+            position = 0
+            index = 0
+            while position < total:
+                block_end = min(total, position + block_samples)
+                parts = []
+                while index < len(events) and targets[index] < block_end:
+                    if targets[index] > position:
+                        parts.append(synth.get_samples(targets[index] - position))
+                        position = targets[index]
+                    _, is_on, channel, pitch, velocity = events[index]
+                    if is_on:
+                        synth.noteon(channel, pitch, velocity)
+                    else:
+                        synth.noteoff(channel, pitch)
+                    index += 1
+                parts.append(synth.get_samples(block_end - position))
+                position = block_end
+                yield np.concatenate(parts).reshape(-1, 2).mean(axis=1) / 32768.0
+        finally:
+            # All sound off, so the next job starts from silence
+            for channel in programs:
+                synth.cc(channel, 120, 0)
+            synth.get_samples(SAMPLE_RATE // 10)
+
+def render_midi(pm, sample_rate=SAMPLE_RATE):
+    """Render a PrettyMIDI object with the resident synthesizer; returns mono float64"""
+    blocks = list(iter_render_blocks(pm, ENCODE_BLOCK_SAMPLES, sample_rate))
+    return np.concatenate(blocks) if blocks else np.zeros(0)
+
+def synthesize_audio(midi_path, wav_path, duration):
+    """CLI fallback: render midi_path to wav_path with the fluidsynth binary"""
     try:
         if not check_fluidsynth_installation():
             raise RuntimeError("FluidSynth is not installed. Please install it first.")
 
-        sf2_path = os.path.join(os.path.dirname(__file__), "FluidR3_GM.sf2")
+        sf2_path = SOUNDFONT_PATH
         if not check_soundfont(sf2_path):
             raise FileNotFoundError(f"Soundfont file not found at {sf2_path}")
 
@@ -108,15 +224,14 @@ def synthesize_audio(midi_path, wav_path, tempo):
         print(f"Converting MIDI to WAV: {midi_path} -> {wav_path}", file=sys.stderr)
         
         # Calculate render time buffer (duration + 20%)
-        midi_duration = pretty_midi.PrettyMIDI(midi_path).get_end_time()
-        timeout = max(30, int(midi_duration * 1.2))
+        timeout = max(30, int(duration * 1.2))
         
         # FluidSynth configuration for humming conversion
         command = [
             "fluidsynth", 
             "-F", wav_path,
-            "-r", "44100",
-            "-g", "0.8",           # Gain adjustment
+            "-r", str(SAMPLE_RATE),
+            "-g", str(SYNTH_GAIN),  # Gain adjustment
             "-C", "0",              # Disable chorus
             "-R", "0",              # Disable reverb
             "-T", "wav",
@@ -152,86 +267,540 @@ def synthesize_audio(midi_path, wav_path, tempo):
         print(f"Error in synthesize_audio: {str(e)}", file=sys.stderr)
         raise
 
-def post_process_audio(input_path, output_path):
-    """Apply EQ and compression to enhance instrument sound"""
+def resolve_output_format(fmt, bitrate=None):
+    """Validate an output format; returns (format, bitrate or None for WAV)"""
+    fmt = (fmt or "wav").lower()
+    if fmt not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format: {fmt}")
+    default_bitrate = OUTPUT_FORMATS[fmt][2]
+    return fmt, (str(bitrate) if bitrate else default_bitrate) if default_bitrate else None
+
+def _split_blocks(y, block_samples=ENCODE_BLOCK_SAMPLES):
+    return (y[offset:offset + block_samples] for offset in range(0, len(y), block_samples))
+
+def _pcm16(block):
+    """Float block -> little-endian 16-bit PCM bytes; every output path quantizes here"""
+    return np.clip(np.round(block * 32768), -32768, 32767).astype("<i2").tobytes()
+
+def _write_wav(blocks, output_path, sample_rate):
+    with sf.SoundFile(output_path, "w", sample_rate, 1, subtype="PCM_16") as f:
+        for block in blocks:
+            f.write(np.frombuffer(_pcm16(block), dtype="<i2"))
+
+def _wav_stream_header(sample_rate):
+    """16-bit mono RIFF header with unknown (maximum) sizes, for WAV sent down a pipe"""
+    return (b"RIFF" + struct.pack("<I", 0xFFFFFFFF) + b"WAVEfmt "
+            + struct.pack("<IHHIIHH", 16, 1, 1, sample_rate, sample_rate * 2, 2, 16)
+            + b"data" + struct.pack("<I", 0xFFFFFFFF))
+
+def _ffmpeg_encode_command(output, sample_rate, encoder, bitrate, muxer=None):
+    command = [
+        "ffmpeg", "-y", "-loglevel", "error",
+        "-f", "s16le", "-ar", str(sample_rate), "-ac", "1", "-i", "pipe:0",
+        "-c:a", encoder, "-b:a", bitrate
+    ]
+    if muxer is not None:
+        # Emit packets (and small Ogg pages) as soon as they are encoded
+        command += ["-flush_packets", "1", "-f", muxer]
+        if muxer == "ogg":
+            command += ["-page_duration", "20000"]
+    return command + [output]
+
+def _pipe_to_ffmpeg(blocks, output_path, sample_rate, encoder, bitrate):
+    """Stream 16-bit PCM blocks into an ffmpeg encoder as they are produced"""
+    command = _ffmpeg_encode_command(output_path, sample_rate, encoder, bitrate)
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
     try:
-        command = [
-            "ffmpeg", "-y", "-i", input_path,
-            "-af", "aformat=sample_fmts=s16:channel_layouts=mono,"
-                    "equalizer=f=1000:width_type=h:width=2000:g=5,"
-                    "compand=attacks=0.1:decays=0.4:points=-80/-80|-30/-10|0/0",
-            "-ar", "44100",
-            output_path
-        ]
-        subprocess.run(command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        for block in blocks:
+            process.stdin.write(_pcm16(block))
+        process.stdin.close()
+    except BrokenPipeError:
+        pass  # ffmpeg exited early; its stderr says why
+    stderr = process.stderr.read().decode(errors="replace")
+    if process.wait() != 0:
+        raise RuntimeError(f"ffmpeg {encoder} encoding failed: {stderr.strip()}")
+
+def encode_audio(y, output_stem, fmt="wav", bitrate=None, sample_rate=SAMPLE_RATE):
+    """Post-process mono float audio and write output_stem + the format's extension.
+
+    Compressed formats are encoded by ffmpeg in the same pass. If that
+    fails the audio is written as WAV instead; returns (path, format).
+    """
+    extension, encoder, _, _ = OUTPUT_FORMATS[fmt]
+    if encoder is not None:
+        output_path = output_stem + extension
+        try:
+            _pipe_to_ffmpeg(post_process_blocks(_split_blocks(y), sample_rate), output_path, sample_rate, encoder, bitrate)
+            return output_path, fmt
+        except (OSError, RuntimeError) as e:
+            print(f"{fmt} encoding failed, writing WAV instead: {str(e)}", file=sys.stderr)
+            if os.path.exists(output_path):
+                os.remove(output_path)
+
+    output_path = output_stem + ".wav"
+    _write_wav(post_process_blocks(_split_blocks(y), sample_rate), output_path, sample_rate)
+    return output_path, "wav"
+
+def post_process_audio(input_path, output_stem, fmt="wav", bitrate=None):
+    """Post-process and encode a WAV rendered by the fluidsynth CLI"""
+    try:
+        y, sample_rate = sf.read(input_path, dtype="float64", always_2d=True)
+        return encode_audio(y.mean(axis=1), output_stem, fmt, bitrate, sample_rate)
     except Exception as e:
         print(f"Audio post-processing failed: {str(e)}", file=sys.stderr)
         # Use original if processing fails
-        os.replace(input_path, output_path)
+        os.replace(input_path, output_stem + ".wav")
+        return output_stem + ".wav", "wav"
 
-if __name__ == "__main__":
+# Humming-optimized instrument mapping
+INSTRUMENT_MAP = {
+    "violin": 40,
+    "cello": 42,
+    "flute": 73,
+    "trumpet": 56,
+    "clarinet": 71,
+    "oboe": 68,
+    "sax": 66,
+    "piano": 0,
+    "guitar": 24,
+    "harmonica": 22
+}
+
+DEFAULT_INSTRUMENT = "Acoustic Grand Piano"
+
+def resolve_instrument(instrument_arg):
+    """Instrument name -> (General MIDI program, is_drum)"""
+    is_drum = instrument_arg.lower() in ["drum", "drums", "percussion", "drum kit"]
+    if instrument_arg.lower() in INSTRUMENT_MAP:
+        program = INSTRUMENT_MAP[instrument_arg.lower()]
+    else:
+        program = 0 if is_drum else pretty_midi.instrument_name_to_program(instrument_arg.title())
+    return program, is_drum
+
+def unwrap_notes(data):
+    """Accept a bare note list or the analysis pipeline's output format"""
+    if isinstance(data, dict) and "analysis" in data:
+        return data["analysis"]
+    if isinstance(data, dict) and "error" in data:
+        raise RuntimeError(f"Analysis error: {data['error']}")
+    return data
+
+def get_render_cache():
+    """Process-wide render cache, or None when disabled"""
+    global _render_cache
+    if _render_cache is None and RENDER_CACHE_MAX_MB > 0:
+        _render_cache = DiskLRUCache(RENDER_CACHE_DIR, int(RENDER_CACHE_MAX_MB * 1024 * 1024))
+    return _render_cache
+
+def _soundfont_identity():
+    """Name, size and mtime of the soundfont, so replacing the file invalidates renders"""
+    stat = os.stat(SOUNDFONT_PATH)
+    return [os.path.basename(SOUNDFONT_PATH), stat.st_size, stat.st_mtime_ns]
+
+def render_key(pm, tempo, fmt="wav", bitrate=None):
+    """Canonical hash of what ends up in the output: the MIDI notes, programs and render settings"""
+    instruments = [
+        [instrument.program, instrument.is_drum,
+         [[note.pitch, note.start, note.end, note.velocity] for note in instrument.notes]]
+        for instrument in pm.instruments
+    ]
+    settings = {
+        "engine": "inprocess" if use_inprocess_synth() else "cli",
+        "sample_rate": SAMPLE_RATE,
+        "gain": SYNTH_GAIN,
+        "release": RELEASE_SECONDS,
+        "soundfont": _soundfont_identity(),
+        "format": fmt,
+        "bitrate": bitrate,
+    }
+    return hash_key("render", instruments, tempo, settings, CODE_VERSION)
+
+def _copy_from_cache(cached_path, output_path):
+    # Hard link when possible; the caller deletes the job directory, not the cache entry
     try:
-        print("Python script started", file=sys.stderr)
-        instrument_arg = sys.argv[1] if len(sys.argv) > 1 else "Acoustic Grand Piano"
-        is_drum = instrument_arg.lower() in ["drum", "drums", "percussion", "drum kit"]
-        
-        # Humming-optimized instrument mapping
-        instrument_map = {
-            "violin": 40,
-            "cello": 42,
-            "flute": 73,
-            "trumpet": 56,
-            "clarinet": 71,
-            "oboe": 68,
-            "sax": 66,
-            "piano": 0,
-            "guitar": 24,
-            "harmonica": 22
-        }
-        
-        if instrument_arg.lower() in instrument_map:
-            program = instrument_map[instrument_arg.lower()]
-        else:
-            program = 0 if is_drum else pretty_midi.instrument_name_to_program(instrument_arg.title())
-        
-        print(f"Using instrument: {instrument_arg} (program: {program}, is_drum: {is_drum})", file=sys.stderr)
+        os.link(cached_path, output_path)
+    except OSError:
+        shutil.copyfile(cached_path, output_path)
 
-        # Read input notes from stdin
-        stdin_data = sys.stdin.read()
-        data = json.loads(stdin_data)
-        
-        # Handle analysis pipeline output format
-        if "analysis" in data:
-            note_objs = data["analysis"]
-        elif "error" in data:
-            raise RuntimeError(f"Analysis error: {data['error']}")
+def use_inprocess_synth():
+    return fluidsynth is not None and SYNTH_ENGINE != "cli"
+
+def _output_stem(instrument_arg):
+    return re.sub(r"[^a-z0-9]+", "_", instrument_arg.lower()).strip("_") or "instrument"
+
+def _unique_stem(instrument_arg, taken):
+    """Output stem for instrument_arg that none of the `taken` stems uses"""
+    stem = base = _output_stem(instrument_arg)
+    suffix = 2
+    while stem in taken:
+        stem = f"{base}_{suffix}"
+        suffix += 1
+    return stem
+
+def _make_job_dir(output_root):
+    os.makedirs(output_root, exist_ok=True)
+    return os.path.abspath(tempfile.mkdtemp(prefix="synth-", dir=output_root))
+
+def render_instrument(notes, instrument_arg, job_dir, stem="output", fmt="wav", bitrate=None):
+    """Render parsed notes with one instrument to job_dir/<stem> plus the format's extension (and .mid)"""
+    timer = StageTimer()
+    program, is_drum = resolve_instrument(instrument_arg)
+    print(f"Using instrument: {instrument_arg} (program: {program}, is_drum: {is_drum})", file=sys.stderr)
+
+    midi_path = os.path.join(job_dir, f"{stem}.mid")
+    raw_wav_path = os.path.join(job_dir, f"raw_{stem}.wav")
+    output_stem = os.path.join(job_dir, stem)
+    output_fmt = fmt
+
+    cache = get_render_cache()
+    cache_hit = False
+    with timer.activate():
+        with timed("midi"):
+            pm, tempo = build_midi(notes, program, is_drum)
+            pm.write(midi_path)
+        key = render_key(pm, tempo, fmt, bitrate) if cache is not None else None
+        cached_path = cache.get_path(key) if cache is not None else None
+        if cached_path is not None:
+            with timed("cache_load"):
+                output_path = output_stem + OUTPUT_FORMATS[fmt][0]
+                _copy_from_cache(cached_path, output_path)
+            cache_hit = True
+            print(f"Render cache hit: {key[:12]}", file=sys.stderr)
+        elif use_inprocess_synth():
+            with timed("synth"):
+                y = render_midi(pm)
+            with timed("post_process"):
+                output_path, output_fmt = encode_audio(y, output_stem, fmt, bitrate)
         else:
-            note_objs = data
+            with timed("synth"):
+                synthesize_audio(midi_path, raw_wav_path, pm.get_end_time())
+            with timed("post_process"):
+                output_path, output_fmt = post_process_audio(raw_wav_path, output_stem, fmt, bitrate)
+        # A WAV written because encoding failed is not what this key describes
+        if cache is not None and not cache_hit and output_fmt == fmt:
+            with timed("cache_store"):
+                cache.put_file(key, output_path)
+
+    # Clean up temporary files
+    if os.path.exists(raw_wav_path):
+        os.remove(raw_wav_path)
+
+    timings = timer.as_dict()
+    append_metrics(os.environ.get("SYNTH_METRICS_FILE", ""), {
+        "instrument": instrument_arg,
+        "notes": len(notes),
+        "format": output_fmt,
+        "cache_hit": cache_hit,
+        "timings": timings
+    })
+    return {
+        "instrument": instrument_arg,
+        "program": program,
+        "tempo": tempo,
+        "output_file": output_path,
+        "format": output_fmt,
+        "midi_file": midi_path,
+        "cache_hit": cache_hit,
+        "timings": timings
+    }
+
+def render_job(note_objs, instrument_arg=DEFAULT_INSTRUMENT, output_root="uploads", fmt="wav", bitrate=None):
+    """Render one conversion into its own job directory under output_root.
+
+    Every file a job writes lives in a fresh directory, so any number of
+    conversions can run at once; the caller removes job_dir when done.
+    """
+    fmt, bitrate = resolve_output_format(fmt, bitrate)
+    notes = notes_from_dicts(note_objs)
+    job_dir = _make_job_dir(output_root)
+    try:
+        output = render_instrument(notes, instrument_arg, job_dir, fmt=fmt, bitrate=bitrate)
+    except Exception:
+        shutil.rmtree(job_dir, ignore_errors=True)
+        raise
+
+    cache = get_render_cache()
+    return {
+        "status": "success",
+        "message": "Audio synthesized successfully",
+        "tempo": output["tempo"],
+        "output_file": output["output_file"],
+        "format": output["format"],
+        "midi_file": output["midi_file"],
+        "job_dir": job_dir,
+        "timings": output["timings"],
+        "cache": dict(cache.stats(), hit=output["cache_hit"]) if cache is not None else None
+    }
+
+def render_multi(note_objs, instruments, output_root="uploads", fmt="wav", bitrate=None):
+    """Render one note list with several instruments into a single job directory.
+
+    Notes are parsed once and the instruments render one after another on
+    this worker's resident synth, so the soundfont is loaded once and the
+    job uses a single core like any other conversion; parallelism comes from
+    running several synth workers. Returns one entry per requested
+    instrument under "outputs", in request order; names that resolve to the
+    same program (e.g. "Violin" and "violin") share one render and file.
+    """
+    if not instruments:
+        raise ValueError("No instruments given")
+
+    fmt, bitrate = resolve_output_format(fmt, bitrate)
+    notes = notes_from_dicts(note_objs)
+    job_dir = _make_job_dir(output_root)
+    timer = StageTimer()
+    rendered = {}
+    stems = set()
+    outputs = []
+    try:
+        with timer.activate(), timed("render"):
+            for instrument_arg in instruments:
+                key = resolve_instrument(instrument_arg)
+                if key not in rendered:
+                    stem = _unique_stem(instrument_arg, stems)
+                    stems.add(stem)
+                    rendered[key] = render_instrument(notes, instrument_arg, job_dir, stem, fmt, bitrate)
+                outputs.append(dict(rendered[key], instrument=instrument_arg))
+    except Exception:
+        shutil.rmtree(job_dir, ignore_errors=True)
+        raise
+
+    return {
+        "status": "success",
+        "message": f"Synthesized {len(rendered)} instruments",
+        "tempo": outputs[0]["tempo"],
+        "outputs": outputs,
+        "job_dir": job_dir,
+        "timings": timer.as_dict()
+    }
+
+class StreamSink:
+    """Binary output that counts bytes and records the time to the first byte"""
+
+    def __init__(self, out):
+        self.out = out
+        self.started = time.perf_counter()
+        self.bytes = 0
+        self.first_chunk_s = None
+
+    def send(self, data):
+        if not data:
+            return
+        if self.first_chunk_s is None:
+            self.first_chunk_s = time.perf_counter() - self.started
+        self.out.write(data)
+        self.out.flush()
+        self.bytes += len(data)
+
+def _stream_encoded(blocks, sink, fmt, bitrate, sample_rate=SAMPLE_RATE):
+    """Encode processed blocks into sink as they are produced"""
+    _, encoder, _, muxer = OUTPUT_FORMATS[fmt]
+    if encoder is None:
+        # The header goes out with the first block so first_chunk_s measures real audio
+        header = _wav_stream_header(sample_rate)
+        for block in blocks:
+            sink.send(header + _pcm16(block))
+            header = b""
+        return
+
+    command = _ffmpeg_encode_command("pipe:1", sample_rate, encoder, bitrate, muxer)
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    copy_error = []
 
-        output_dir = "uploads"
-        os.makedirs(output_dir, exist_ok=True)
+    def copy_output():
+        try:
+            for chunk in iter(lambda: process.stdout.read1(65536), b""):
+                sink.send(chunk)
+        except Exception as e:
+            # The reader went away; stop ffmpeg so the writer below does not block
+            copy_error.append(e)
+            process.kill()
+
+    copier = threading.Thread(target=copy_output, daemon=True)
+    copier.start()
+    try:
+        for block in blocks:
+            process.stdin.write(_pcm16(block))
+            process.stdin.flush()
+        process.stdin.close()
+    except BrokenPipeError:
+        pass
+    copier.join()
+    stderr = process.stderr.read().decode(errors="replace")
+    if copy_error:
+        raise copy_error[0]
+    if process.wait() != 0:
+        raise RuntimeError(f"ffmpeg {encoder} encoding failed: {stderr.strip()}")
+
+def _render_with_cli(pm):
+    """Render through the fluidsynth CLI in a scratch directory; returns mono float64"""
+    with tempfile.TemporaryDirectory(prefix="synth-stream-") as scratch:
+        midi_path = os.path.join(scratch, "output.mid")
+        wav_path = os.path.join(scratch, "raw_output.wav")
+        pm.write(midi_path)
+        synthesize_audio(midi_path, wav_path, pm.get_end_time())
+        y, _ = sf.read(wav_path, dtype="float64", always_2d=True)
+    return y.mean(axis=1)
+
+def stream_job(note_objs, instrument_arg, out, fmt="wav", bitrate=None):
+    """Render one conversion straight into the binary stream `out`.
+
+    With the in-process synthesizer each block is rendered, post-processed
+    and encoded before the next one is rendered, so audio starts flowing
+    after one block rather than after the whole melody. The CLI fallback
+    renders everything first. Repeat requests stream the cached render.
+    """
+    sink = StreamSink(out)
+    timer = StageTimer()
+    fmt, bitrate = resolve_output_format(fmt, bitrate)
+    program, is_drum = resolve_instrument(instrument_arg)
+    print(f"Streaming {instrument_arg} (program: {program}, is_drum: {is_drum}) as {fmt}", file=sys.stderr)
 
-        midi_path = os.path.join(output_dir, "output.mid")
-        raw_wav_path = os.path.join(output_dir, "raw_output.wav")
-        final_wav_path = os.path.join(output_dir, "output.wav")
+    with timer.activate():
+        with timed("midi"):
+            pm, tempo = build_midi(notes_from_dicts(note_objs), program, is_drum)
+        cache = get_render_cache()
+        cached_path = cache.get_path(render_key(pm, tempo, fmt, bitrate)) if cache is not None else None
+        with timed("stream"):
+            if cached_path is not None:
+                with open(cached_path, "rb") as f:
+                    for chunk in iter(lambda: f.read(65536), b""):
+                        sink.send(chunk)
+            else:
+                if use_inprocess_synth():
+                    blocks = iter_render_blocks(pm)
+                else:
+                    blocks = _split_blocks(_render_with_cli(pm), STREAM_BLOCK_SAMPLES)
+                _stream_encoded(post_process_blocks(blocks, SAMPLE_RATE), sink, fmt, bitrate)
+
+    timings = timer.as_dict()
+    first_chunk_ms = round(sink.first_chunk_s * 1000, 1) if sink.first_chunk_s is not None else None
+    append_metrics(os.environ.get("SYNTH_METRICS_FILE", ""), {
+        "instrument": instrument_arg,
+        "notes": len(note_objs),
+        "format": fmt,
+        "stream": True,
+        "cache_hit": cached_path is not None,
+        "first_chunk_ms": first_chunk_ms,
+        "timings": timings
+    })
+    return {
+        "status": "success",
+        "message": "Audio streamed successfully",
+        "tempo": tempo,
+        "format": fmt,
+        "bytes": sink.bytes,
+        "first_chunk_ms": first_chunk_ms,
+        "cache_hit": cached_path is not None,
+        "timings": timings
+    }
+
+def _stream_to_socket(job, socket_path):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        with sock.makefile("wb") as out:
+            return stream_job(
+                unwrap_notes(job["notes"]), job.get("instrument") or DEFAULT_INSTRUMENT, out,
+                job.get("format"), job.get("bitrate")
+            )
 
-        tempo = notes_to_midi(note_objs, midi_path, program, is_drum)
-        synthesize_audio(midi_path, raw_wav_path, tempo)
-        post_process_audio(raw_wav_path, final_wav_path)
+def _write_message(message):
+    sys.stdout.write(json.dumps(message) + "\n")
+    sys.stdout.flush()
 
-        # Clean up temporary files
-        if os.path.exists(raw_wav_path):
-            os.remove(raw_wav_path)
+def run_worker(output_root="uploads"):
+    """Serve conversions as newline-delimited JSON over stdin/stdout.
+
+    Each input line is {"id", "notes", "instrument", "output_root"?,
+    "format"?, "bitrate"?}; each
+    output line is render_job's result (or {"status": "error"}) with the id
+    echoed back. Run several workers to render in parallel across cores.
+    A job with an "instruments" list goes through render_multi instead, and
+    one with "stream_socket" streams the encoded audio to that Unix socket
+    (see stream_job) and then reports on stdout as usual.
+    """
+    if use_inprocess_synth():
+        get_synth()  # pay the soundfont load before accepting jobs
+    _write_message({"ready": True, "pid": os.getpid()})
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+
+        job_id = None
+        try:
+            job = json.loads(line)
+            job_id = job.get("id")
+            print(f"Synth worker received job {job_id}", file=sys.stderr)
+            encoding = {"fmt": job.get("format"), "bitrate": job.get("bitrate")}
+            if job.get("stream_socket"):
+                result = _stream_to_socket(job, job["stream_socket"])
+            elif job.get("instruments"):
+                result = render_multi(
+                    unwrap_notes(job["notes"]), job["instruments"], job.get("output_root") or output_root,
+                    **encoding
+                )
+            else:
+                result = render_job(
+                    unwrap_notes(job["notes"]),
+                    job.get("instrument") or DEFAULT_INSTRUMENT,
+                    job.get("output_root") or output_root,
+                    **encoding
+                )
+        except Exception as e:
+            print(f"Synth job {job_id} failed: {str(e)}", file=sys.stderr)
+            result = {"status": "error", "message": str(e)}
+
+        result["id"] = job_id
+        _write_message(result)
+
+def main():
+    parser = argparse.ArgumentParser(description="Render note JSON to instrument audio")
+    parser.add_argument("instruments", nargs="*", metavar="instrument",
+                        help="Instrument name; give several to render each in one pass")
+    parser.add_argument("--worker", action="store_true",
+                        help="Stay resident and read NDJSON jobs from stdin")
+    parser.add_argument("--output-root", default="uploads",
+                        help="Directory that per-job output directories are created in")
+    parser.add_argument("--format", choices=sorted(OUTPUT_FORMATS), default="wav",
+                        help="Output encoding; compressed formats are encoded with ffmpeg")
+    parser.add_argument("--bitrate", help="Bitrate for compressed formats, e.g. 64k")
+    parser.add_argument("--stream", action="store_true",
+                        help="Write the encoded audio to stdout while rendering; the summary goes to stderr")
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.output_root)
+        return
+
+    if args.stream:
+        try:
+            note_objs = unwrap_notes(json.loads(sys.stdin.read()))
+            instrument = args.instruments[0] if args.instruments else DEFAULT_INSTRUMENT
+            result = stream_job(note_objs, instrument, sys.stdout.buffer, args.format, args.bitrate)
+            print(json.dumps(result), file=sys.stderr)
+        except Exception as e:
+            print(json.dumps({"status": "error", "message": str(e)}), file=sys.stderr)
+            sys.exit(1)
+        return
+
+    try:
+        print("Python script started", file=sys.stderr)
+        # Read input notes from stdin
+        note_objs = unwrap_notes(json.loads(sys.stdin.read()))
+        if len(args.instruments) > 1:
+            result = render_multi(note_objs, args.instruments, args.output_root, args.format, args.bitrate)
+        else:
+            instrument = args.instruments[0] if args.instruments else DEFAULT_INSTRUMENT
+            result = render_job(note_objs, instrument, args.output_root, args.format, args.bitrate)
 
         # Only print JSON to stdout at the very end
-        print(json.dumps({
-            "status": "success",
-            "message": "Audio synthesized successfully",
-            "tempo": tempo,
-            "output_file": final_wav_path
-        }))
+        print(json.dumps(result))
         
     except Exception as e:
         # Only print JSON to stdout for errors too
         print(json.dumps({"status": "error", "message": str(e)}))
-        sys.exit(1)
\ No newline at end of file
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
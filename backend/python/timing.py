@@ -0,0 +1,71 @@
+import contextvars
+import cProfile
+import json
+import os
+import time
+from contextlib import contextmanager
+
+# The StageTimer for the request currently being processed, if any
+_current_timer = contextvars.ContextVar("stage_timer", default=None)
+
+class StageTimer:
+    """Accumulates wall-clock seconds per named pipeline stage"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    @contextmanager
+    def activate(self):
+        """Make this the timer that timed() records into for the current context"""
+        token = _current_timer.set(self)
+        try:
+            yield self
+        finally:
+            _current_timer.reset(token)
+
+    def as_dict(self):
+        timings = {name: round(seconds, 4) for name, seconds in self.stages.items()}
+        timings["total"] = round(time.perf_counter() - self.started, 4)
+        return timings
+
+@contextmanager
+def timed(name):
+    """Time a block into the active StageTimer; a no-op when none is active"""
+    timer = _current_timer.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timer is not None:
+            timer.add(name, time.perf_counter() - start)
+
+@contextmanager
+def maybe_profile(enabled, profile_dir, label):
+    """cProfile the block when enabled; yields a dict that receives the dump path"""
+    info = {}
+    if not enabled:
+        yield info
+        return
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield info
+    finally:
+        profiler.disable()
+        os.makedirs(profile_dir, exist_ok=True)
+        path = os.path.join(profile_dir, f"{label}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.prof")
+        profiler.dump_stats(path)
+        info["profile_file"] = path
+
+def append_metrics(path, record):
+    """Append one JSON line to a metrics file; no-op when path is empty"""
+    if not path:
+        return
+    record = dict(record, timestamp=round(time.time(), 3))
+    with open(path, "a") as f:
+        f.write(json.dumps(record) + "\n")
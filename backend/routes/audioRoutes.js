@@ -7,14 +7,27 @@ const path = require("path");
 const {cloudinary,upload} = require("../helpers/cloudinary.js");
 const {uploadAudio,generateInstrumentAudio} = require("../controllers/audioController.js");
 // const { detectPitch } = require("../controllers/detectPitchController.js");
-const { analyzeAudio } = require("../controllers/analyzeController.js");
-const {convertAudio} = require("../controllers/convertController.js");
+const { analyzeAudio, analyzeBatch } = require("../controllers/analyzeController.js");
+const {convertAudio, streamConvert} = require("../controllers/convertController.js");
+const { startStream, pushStreamChunk, endStream } = require("../controllers/streamController.js");
+const { getJob, getJobMetrics } = require("../controllers/jobController.js");
 
 router.post("/upload", upload.single("audio"), uploadAudio);
 // router.post("/generate", generateInstrumentAudio);
 // router.post("/detect-pitch", detectPitch);
 router.post("/analyze", analyzeAudio);
+router.post("/analyze/batch", analyzeBatch);
 router.post("/convert",convertAudio)
+router.post("/convert/stream", streamConvert);
+
+// Queued analyze/convert jobs (submitted with async: true) and queue metrics
+router.get("/jobs/metrics", getJobMetrics);
+router.get("/jobs/:id", getJob);
+
+// Live transcription: start a session, upload recorder chunks in order, then end it
+router.post("/stream", startStream);
+router.post("/stream/:id/chunk", express.raw({ type: "*/*", limit: "5mb" }), pushStreamChunk);
+router.post("/stream/:id/end", endStream);
 
 // @route   GET /api/audio/
 // @desc    Get all audios
@@ -0,0 +1,216 @@
+// backend/utils/jobQueue.js
+const crypto = require('crypto');
+const os = require('os');
+
+// Cores the Python workers may use between them; each queue takes a share.
+const CPU_BUDGET = Number(process.env.JOB_CPU_BUDGET) || Math.max(1, os.cpus().length - 1);
+const JOB_RETAIN_MS = Number(process.env.JOB_RETAIN_MS) || 10 * 60 * 1000;
+
+// Worker count for a queue allowed `share` of the core budget; an explicit count wins.
+const workersForShare = (share, explicit) =>
+  Number(explicit) || Math.max(1, Math.floor(CPU_BUDGET * share));
+
+class QueueFullError extends Error {
+  constructor(queueName, depth) {
+    super(`${queueName} queue is full (${depth} jobs waiting), try again shortly`);
+    this.name = 'QueueFullError';
+    this.statusCode = 503;
+  }
+}
+
+// In-process job queue in front of a Python worker pool. At most
+// `concurrency` jobs run at once (match it to the pool size so the pool never
+// queues internally); the rest wait here and the queue refuses work past
+// `maxQueued`, so a burst queues instead of oversubscribing the CPU.
+//
+// Jobs carry a priority in seconds of audio: shorter clips go first, and
+// every second spent waiting counts as `agingPerSecond` seconds off, so
+// long clips are delayed but never starved. Finished jobs stay pollable by
+// id for JOB_RETAIN_MS.
+class JobQueue {
+  constructor(name, { concurrency = 1, maxQueued = 100, agingPerSecond = 1 } = {}) {
+    this.name = name;
+    this.concurrency = concurrency;
+    this.maxQueued = maxQueued;
+    this.agingPerSecond = agingPerSecond;
+    this.waiting = [];
+    this.running = 0;
+    this.jobs = new Map();
+    this.counts = { submitted: 0, completed: 0, failed: 0, rejected: 0 };
+    this.totals = { waitMs: 0, runMs: 0 };
+    this.maxDepthSeen = 0;
+  }
+
+  submit(run, { priority = 0, meta = {} } = {}) {
+    if (this.waiting.length >= this.maxQueued) {
+      this.counts.rejected++;
+      throw new QueueFullError(this.name, this.waiting.length);
+    }
+
+    const job = {
+      id: crypto.randomUUID(),
+      queue: this.name,
+      status: 'queued',
+      priority,
+      meta,
+      run,
+      createdAt: Date.now(),
+      startedAt: null,
+      finishedAt: null,
+      result: undefined,
+      error: null,
+    };
+    job.promise = new Promise((resolve, reject) => {
+      job.resolve = resolve;
+      job.reject = reject;
+    });
+    // Polled jobs may never be awaited
+    job.promise.catch(() => { });
+
+    this.jobs.set(job.id, job);
+    this.waiting.push(job);
+    this.counts.submitted++;
+    this.maxDepthSeen = Math.max(this.maxDepthSeen, this.waiting.length);
+    if (this.running >= this.concurrency) {
+      console.log(`⏳ [${this.name}] Job ${job.id} queued (${this.waiting.length} waiting, ${this.running} running)`);
+    }
+    this._drain();
+    return job;
+  }
+
+  get(id) {
+    return this.jobs.get(id);
+  }
+
+  describe(job) {
+    const now = Date.now();
+    const order = this.waiting.slice().sort((a, b) => this._score(a, now) - this._score(b, now));
+    return {
+      id: job.id,
+      queue: job.queue,
+      status: job.status,
+      position: job.status === 'queued' ? order.indexOf(job) + 1 : 0,
+      priority: job.priority,
+      createdAt: new Date(job.createdAt).toISOString(),
+      waitMs: (job.startedAt || now) - job.createdAt,
+      runMs: job.startedAt ? (job.finishedAt || now) - job.startedAt : 0,
+      ...(job.status === 'done' ? { result: job.result } : {}),
+      ...(job.status === 'failed' ? { error: job.error } : {}),
+    };
+  }
+
+  stats() {
+    const finished = this.counts.completed + this.counts.failed;
+    return {
+      name: this.name,
+      concurrency: this.concurrency,
+      running: this.running,
+      queued: this.waiting.length,
+      maxQueued: this.maxQueued,
+      maxDepthSeen: this.maxDepthSeen,
+      ...this.counts,
+      avgWaitMs: finished ? Math.round(this.totals.waitMs / finished) : 0,
+      avgRunMs: finished ? Math.round(this.totals.runMs / finished) : 0,
+    };
+  }
+
+  _score(job, now) {
+    return job.priority - ((now - job.createdAt) / 1000) * this.agingPerSecond;
+  }
+
+  _next() {
+    const now = Date.now();
+    let best = 0;
+    for (let i = 1; i < this.waiting.length; i++) {
+      if (this._score(this.waiting[i], now) < this._score(this.waiting[best], now)) {
+        best = i;
+      }
+    }
+    return this.waiting.splice(best, 1)[0];
+  }
+
+  _drain() {
+    while (this.running < this.concurrency && this.waiting.length) {
+      const job = this._next();
+      this.running++;
+      job.status = 'running';
+      job.startedAt = Date.now();
+
+      Promise.resolve()
+        .then(() => job.run())
+        .then((result) => {
+          job.status = 'done';
+          job.result = result;
+          this.counts.completed++;
+          job.resolve(result);
+        }, (err) => {
+          job.status = 'failed';
+          job.error = err.message || String(err);
+          this.counts.failed++;
+          job.reject(err);
+        })
+        .finally(() => {
+          job.finishedAt = Date.now();
+          job.run = null;
+          this.totals.waitMs += job.startedAt - job.createdAt;
+          this.totals.runMs += job.finishedAt - job.startedAt;
+          this.running--;
+          setTimeout(() => this.jobs.delete(job.id), JOB_RETAIN_MS).unref();
+          this._drain();
+        });
+    }
+  }
+}
+
+const queues = new Map();
+
+// One queue per name for the whole process
+const getQueue = (name, options) => {
+  if (!queues.has(name)) {
+    queues.set(name, new JobQueue(name, options));
+  }
+  return queues.get(name);
+};
+
+const findJob = (id) => {
+  for (const queue of queues.values()) {
+    const job = queue.get(id);
+    if (job) return { queue, job };
+  }
+  return null;
+};
+
+const queueStats = () => ({
+  cpuBudget: CPU_BUDGET,
+  queues: [...queues.values()].map((queue) => queue.stats()),
+});
+
+// Express helpers for controllers that run their work through a queue.
+// Requests opt into polling with { async: true } in the body or ?async=1.
+const isAsyncRequest = (req) => req.body?.async === true || ['1', 'true'].includes(req.query?.async);
+
+const sendAccepted = (res, queue, job) => res.status(202).json({
+  success: true,
+  jobId: job.id,
+  statusUrl: `/api/audio/jobs/${job.id}`,
+  job: queue.describe(job),
+});
+
+const errorStatus = (res, err) => {
+  if (err instanceof QueueFullError) {
+    res.set('Retry-After', '5');
+  }
+  return err.statusCode || 500;
+};
+
+module.exports = {
+  JobQueue,
+  QueueFullError,
+  getQueue,
+  findJob,
+  queueStats,
+  workersForShare,
+  isAsyncRequest,
+  sendAccepted,
+  errorStatus,
+};
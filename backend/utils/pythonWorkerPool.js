@@ -0,0 +1,195 @@
+// backend/utils/pythonWorkerPool.js
+const { spawn } = require('child_process');
+const readline = require('readline');
+
+// Keeps a fixed number of long-lived Python processes (started with --worker)
+// and hands them newline-delimited JSON jobs, one job per worker at a time.
+//
+// Workers that die are respawned with exponential backoff. After
+// `maxRestarts` crashes in a row without any worker becoming ready the pool
+// stops respawning and rejects queued jobs instead of letting them hang; the
+// next job after `restartMaxMs` tries again.
+class PythonWorkerPool {
+  constructor(scriptPath, {
+    size = 2,
+    args = [],
+    jobTimeoutMs = 120000,
+    maxRestarts = 5,
+    restartBaseMs = 500,
+    restartMaxMs = 30000,
+  } = {}) {
+    this.scriptPath = scriptPath;
+    this.size = size;
+    this.args = args;
+    this.jobTimeoutMs = jobTimeoutMs;
+    this.maxRestarts = maxRestarts;
+    this.restartBaseMs = restartBaseMs;
+    this.restartMaxMs = restartMaxMs;
+    this.workers = [];
+    this.pending = [];
+    this.nextJobId = 1;
+    this.closed = false;
+    this.failures = 0;
+    this.restarting = 0;
+    this.gaveUpAt = null;
+  }
+
+  start() {
+    for (let i = 0; i < this.size; i++) {
+      this.workers.push(this._spawnWorker());
+    }
+    return this;
+  }
+
+  run(payload, { timeoutMs = this.jobTimeoutMs } = {}) {
+    if (this.closed) {
+      return Promise.reject(new Error('Python worker pool is shut down'));
+    }
+    if (this.gaveUpAt) {
+      if (Date.now() - this.gaveUpAt < this.restartMaxMs) {
+        return Promise.reject(new Error(`Python workers for ${this.scriptPath} keep crashing, not restarting yet`));
+      }
+      console.log(`🔁 Retrying Python workers for ${this.scriptPath}`);
+      this.gaveUpAt = null;
+      this.failures = 0;
+      while (this.workers.length < this.size) {
+        this.workers.push(this._spawnWorker());
+      }
+    }
+    return new Promise((resolve, reject) => {
+      this.pending.push({ id: String(this.nextJobId++), payload, timeoutMs, resolve, reject });
+      this._dispatch();
+    });
+  }
+
+  shutdown() {
+    this.closed = true;
+    for (const job of this.pending) {
+      job.reject(new Error('Python worker pool is shut down'));
+    }
+    this.pending = [];
+    for (const worker of this.workers) {
+      worker.process.stdin.end();
+    }
+  }
+
+  _spawnWorker() {
+    const proc = spawn('python3', [this.scriptPath, '--worker', ...this.args]);
+    const worker = { process: proc, ready: false, job: null, timer: null };
+    console.log(`🚀 Started Python worker ${proc.pid}: ${this.scriptPath}`);
+
+    readline.createInterface({ input: proc.stdout }).on('line', (line) => {
+      if (!line.trim()) return;
+      let message;
+      try {
+        message = JSON.parse(line);
+      } catch (e) {
+        console.error(`⚠️ Worker ${proc.pid} wrote non-JSON line:`, line);
+        return;
+      }
+
+      if (message.ready) {
+        worker.ready = true;
+        this.failures = 0;
+        console.log(`✅ Python worker ${proc.pid} ready`);
+        this._dispatch();
+        return;
+      }
+
+      const job = worker.job;
+      if (!job || message.id !== job.id) {
+        console.error(`⚠️ Worker ${proc.pid} returned result for unknown job ${message.id}`);
+        return;
+      }
+      clearTimeout(worker.timer);
+      worker.job = null;
+      delete message.id;
+      job.resolve(message);
+      this._dispatch();
+    });
+
+    proc.stderr.on('data', (data) => {
+      console.error(`❌ Python worker ${proc.pid} stderr:`, data.toString());
+    });
+
+    const onGone = (code, signal) => {
+      if (worker.gone) return;
+      worker.gone = true;
+      console.log(`🛑 Python worker ${proc.pid} exited (code ${code}, signal ${signal})`);
+      clearTimeout(worker.timer);
+      if (worker.job) {
+        worker.job.reject(new Error(`Python worker exited with code ${code} while processing job`));
+        worker.job = null;
+      }
+      this.workers = this.workers.filter((w) => w !== worker);
+      if (!this.closed) {
+        // A worker we killed for a slow job is not a crash
+        this._respawn(!worker.timedOut);
+      }
+    };
+    proc.on('exit', onGone);
+
+    // Writing a job to a worker that died before its 'exit' event fails with
+    // EPIPE; without a listener that error would crash the server. 'exit'
+    // still follows, and onGone rejects the job and respawns the worker.
+    proc.stdin.on('error', (err) => {
+      console.error(`❌ Python worker ${proc.pid} stdin error:`, err.message);
+    });
+
+    proc.on('error', (err) => {
+      console.error(`🔥 Failed to spawn Python worker:`, err);
+      // A process that never started emits no 'exit'
+      if (proc.pid === undefined) onGone(null, null);
+    });
+
+    return worker;
+  }
+
+  _respawn(crashed) {
+    if (crashed) this.failures++;
+    if (this.failures > this.maxRestarts) {
+      if (!this.workers.length && !this.restarting) this._giveUp();
+      return;
+    }
+    const delay = crashed
+      ? Math.min(this.restartMaxMs, this.restartBaseMs * 2 ** (this.failures - 1))
+      : 0;
+    if (delay) {
+      console.log(`⏳ Restarting Python worker in ${delay} ms (${this.failures} crashes in a row)`);
+    }
+    this.restarting++;
+    setTimeout(() => {
+      this.restarting--;
+      if (this.closed) return;
+      this.workers.push(this._spawnWorker());
+    }, delay);
+  }
+
+  _giveUp() {
+    console.error(`🔥 Python workers for ${this.scriptPath} crashed ${this.failures} times in a row, giving up for now`);
+    this.gaveUpAt = Date.now();
+    const error = new Error(`Python workers for ${this.scriptPath} failed to start`);
+    for (const job of this.pending) {
+      job.reject(error);
+    }
+    this.pending = [];
+  }
+
+  _dispatch() {
+    for (const worker of this.workers) {
+      if (!this.pending.length) return;
+      if (!worker.ready || worker.job) continue;
+
+      const job = this.pending.shift();
+      worker.job = job;
+      worker.timer = setTimeout(() => {
+        console.error(`⏱️ Job ${job.id} timed out on worker ${worker.process.pid}, restarting it`);
+        worker.timedOut = true;
+        worker.process.kill('SIGKILL');
+      }, job.timeoutMs);
+      worker.process.stdin.write(JSON.stringify({ id: job.id, ...job.payload }) + '\n');
+    }
+  }
+}
+
+module.exports = PythonWorkerPool;
@@ -22,3 +22,44 @@ export const deleteAudioById = async (id) => {
   const res = await axios.delete(`${API_BASE_URL}/${id}`);
   return res.data;
 };
+
+// Live transcription: notes come back with each chunk as they are finalized
+export const startNoteStream = async () => {
+  const res = await axios.post(`${API_BASE_URL}/stream`);
+  return res.data;
+};
+
+export const sendNoteStreamChunk = async (sessionId, chunk) => {
+  const res = await axios.post(`${API_BASE_URL}/stream/${sessionId}/chunk`, chunk, {
+    headers: { 'Content-Type': 'application/octet-stream' },
+  });
+  return res.data;
+};
+
+export const endNoteStream = async (sessionId) => {
+  const res = await axios.post(`${API_BASE_URL}/stream/${sessionId}/end`);
+  return res.data;
+};
+
+// Queued jobs: analyze and convert requests sent with async: true answer
+// 202 with a jobId while the job waits for a worker. Poll its status,
+// backing off to maxIntervalMs, until it finishes.
+export const waitForJob = async (jobId, { intervalMs = 1000, maxIntervalMs = 5000 } = {}) => {
+  let delay = intervalMs;
+  for (;;) {
+    await new Promise((resolve) => setTimeout(resolve, delay));
+    const res = await axios.get(`${API_BASE_URL}/jobs/${jobId}`);
+    const job = res.data.data;
+    if (job.status === 'done') return job.result;
+    if (job.status === 'failed') throw new Error(job.error || 'Job failed');
+    delay = Math.min(maxIntervalMs, delay * 1.5);
+  }
+};
+
+// POST to a queued endpoint and resolve with the same { success, data }
+// body a synchronous call returns, polling if the server queued the job.
+export const postQueuedJob = async (path, body, pollOptions) => {
+  const res = await axios.post(`${API_BASE_URL}${path}`, { ...body, async: true });
+  if (res.status !== 202) return res.data;
+  return { success: true, data: await waitForJob(res.data.jobId, pollOptions) };
+};
@@ -1,5 +1,6 @@
 import { createSlice, createAsyncThunk } from '@reduxjs/toolkit';
 import axios from '../axios.js';
+import { postQueuedJob } from '../api/audioApi.js';
 
 // 🔹 uploadAudio
 export const uploadAudio = createAsyncThunk(
@@ -22,12 +23,13 @@ export const uploadAudio = createAsyncThunk(
 );
 
 // 🔹 analyzeAudio
+// The recording length lets the server's job queue run short takes first
 export const analyzeAudio = createAsyncThunk(
   'audio/analyze',
-  async (audioUrl, { rejectWithValue }) => {
+  async (audioUrl, { getState, rejectWithValue }) => {
     try {
-      const res = await axios.post('/api/audio/analyze', { audioUrl });
-      return res.data;
+      const duration = getState().audio.audioDuration || undefined;
+      return await postQueuedJob('/analyze', { audioUrl, duration });
     } catch (error) {
       const message = error.response?.data?.error || error.message || 'Analysis failed.';
       return rejectWithValue(message);
@@ -40,8 +42,7 @@ export const convertAudio = createAsyncThunk(
   'audio/convert',
   async ({ instrument, notes }, { rejectWithValue }) => {
     try {
-      const res = await axios.post('/api/audio/convert', { instrument, notes });
-      return res.data;
+      return await postQueuedJob('/convert', { instrument, notes });
     } catch (error) {
       const message = error.response?.data?.error || error.message || 'Conversion failed.';
       return rejectWithValue(message);
@@ -54,6 +55,7 @@ const audioSlice = createSlice({
   initialState: {
     recording: null,
     audioUrl: null,
+    audioDuration: null,
     analysis: null,
     convertedAudio: null,
     status: 'idle', // idle | uploading | uploaded | analyzing | analyzed | converting | converted | failed
@@ -66,6 +68,7 @@ const audioSlice = createSlice({
     resetAudioState: (state) => {
       state.recording = null;
       state.audioUrl = null;
+      state.audioDuration = null;
       state.analysis = null;
       state.convertedAudio = null;
       state.status = 'idle';
@@ -73,6 +76,7 @@ const audioSlice = createSlice({
     },
     setAudioUrl: (state, action) => {
       state.audioUrl = action.payload;
+      state.audioDuration = null;
       state.status = 'uploaded';
       state.error = null;
     },
@@ -100,11 +104,13 @@ const audioSlice = createSlice({
       .addCase(uploadAudio.fulfilled, (state, action) => {
         state.status = 'uploaded';
         state.audioUrl = action.payload.data.url;
+        state.audioDuration = action.payload.data.duration || null;
         state.error = null;
       })
       .addCase(uploadAudio.rejected, (state, action) => {
         state.status = 'failed';
         state.audioUrl = null;
+        state.audioDuration = null;
         state.error = action.payload || 'Upload failed.';
       })
 